@@ -0,0 +1,127 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.metrics import record_cache
+
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def version_key(model):
+    return f'version:{model._meta.label_lower}'
+
+
+def get_version(model):
+    """
+    Функция возвращающая текущую версию данных модели. Если версии нет в
+    кеше, она создаётся из текущего времени, чтобы не совпасть с версиями,
+    под которыми в кеше могли остаться старые ответы. Версия хранится без
+    ограничения времени: кеш должен быть общим для всех процессов (см.
+    api.checks), иначе изменения, сделанные в одном процессе, не видны
+    остальным.
+    """
+    key = version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(model):
+    """
+    Функция увеличивающая версию данных модели и возвращающая новую
+    версию. Все закешированные ответы с прежней версией перестают
+    использоваться.
+    """
+    try:
+        return cache.incr(version_key(model))
+    except ValueError:
+        return get_version(model)
+
+
+def make_etag(*parts):
+    """
+    Функция строящая сильный ETag из переданных значений.
+    """
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def not_modified(request, etag):
+    """
+    Функция возвращающая ответ 304 Not Modified, если ETag совпадает с
+    одним из переданных клиентом в If-None-Match, иначе None.
+    """
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in etags or '*' in etags:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
+    return None
+
+
+class VersionedCacheMixin:
+    """
+    Миксин для ReadOnlyModelViewSet, кеширующий отрисованные ответы list и
+    retrieve под ключом с версией модели и поддерживающий ETag с ответом
+    304 Not Modified. Версия увеличивается сигналами при изменении модели.
+    """
+
+    cache_timeout = RESPONSE_CACHE_TIMEOUT
+    response_cache_key = None
+    response_etag = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        model = self.get_queryset().model
+        version = get_version(model)
+        digest = hashlib.md5(
+            f'{request.get_full_path()}|{request.accepted_media_type}'.encode()
+        ).hexdigest()
+        etag = f'"{model._meta.model_name}-{version}-{digest}"'
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        key = f'response:{model._meta.label_lower}:{version}:{digest}'
+        cached = cache.get(key)
+        record_cache('response', hits=cached is not None,
+                     misses=cached is None)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            return response
+        self.response_cache_key = key
+        self.response_etag = etag
+        return handler(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (
+            self.response_cache_key is not None
+            and isinstance(response, Response)
+            and response.status_code == status.HTTP_200_OK
+        ):
+            response.render()
+            cache.set(
+                self.response_cache_key,
+                (response.rendered_content, response['Content-Type']),
+                self.cache_timeout
+            )
+            response['ETag'] = self.response_etag
+        return response
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Версии данных моделей, ответы и изменения индексов хранятся в кеше и
+    должны быть видны всем воркерам gunicorn и командам управления.
+    Кеш в памяти процесса этого не обеспечивает: изменение, сделанное в
+    одном процессе, остальные не увидят.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f'Кеш {backend} хранит версии данных отдельно в каждом процессе.',
+        hint='Укажите в CACHE_BACKEND общий для процессов кеш, например '
+             'django.core.cache.backends.filebased.FileBasedCache или '
+             'Memcached.',
+        id='api.E001',
+    )]
@@ -0,0 +1,113 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+FANOUT_FOLLOWERS_LIMIT = 10000
+FANOUT_CHUNK_SIZE = 1000
+BACKFILL_RECIPES = 100
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='feed')
+
+
+def run_in_background(func, *args):
+    """
+    Функция запускающая func в фоновом потоке после фиксации текущей
+    транзакции, чтобы поток видел сохранённые данные.
+    """
+    def run():
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Ошибка обновления лент: %s', func.__name__)
+        finally:
+            connection.close()
+
+    transaction.on_commit(lambda: executor.submit(run))
+
+
+def chunked(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def add_to_feeds(recipe_id, author_id):
+    """
+    Функция добавляющая новый рецепт в ленты подписчиков автора пачками.
+    Рецепты авторов с большим числом подписчиков в ленты не копируются,
+    они добавляются к ленте при чтении.
+    """
+    followers = Follow.objects.filter(
+        following=author_id,
+        following__followers_count__lte=FANOUT_FOLLOWERS_LIMIT,
+    ).values_list('follower', flat=True)
+    for chunk in chunked(list(followers), FANOUT_CHUNK_SIZE):
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(user_id=user, recipe_id=recipe_id,
+                          author_id=author_id)
+                for user in chunk
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def backfill_feed(user_id, author_id):
+    """
+    Функция добавляющая в ленту подписчика последние рецепты автора.
+    """
+    recipes = Recipe.objects.filter(
+        author=author_id,
+        author__followers_count__lte=FANOUT_FOLLOWERS_LIMIT,
+    ).order_by('-id').values_list('id', flat=True)[:BACKFILL_RECIPES]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, recipe_id=recipe, author_id=author_id)
+            for recipe in recipes
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def prune_feed(user_id, author_id):
+    """
+    Функция удаляющая из ленты рецепты автора после отписки.
+    """
+    FeedEntry.objects.filter(user=user_id, author=author_id).delete()
+
+
+def get_feed_sources(user):
+    """
+    Функция возвращающая источники id рецептов ленты: скопированные в
+    ленту рецепты и рецепты авторов с большим числом подписчиков, на
+    которых подписан пользователь. Скопированные рецепты сверяются с
+    текущими подписками: фоновое удаление после отписки может не
+    выполниться или выполниться раньше добавления.
+    """
+    entries = FeedEntry.objects.filter(user=user).annotate(
+        followed=Exists(Follow.objects.filter(
+            follower=user, following=OuterRef('author')
+        ))
+    ).filter(followed=True)
+    return (
+        (entries, 'recipe_id'),
+        (
+            Recipe.objects.filter(
+                author__in=Follow.objects.filter(
+                    follower=user,
+                    following__followers_count__gt=FANOUT_FOLLOWERS_LIMIT,
+                ).values('following')
+            ),
+            'id',
+        ),
+    )
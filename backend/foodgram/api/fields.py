@@ -0,0 +1,106 @@
+from collections.abc import Mapping
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Поле первичного ключа, которое в списке объектов находит все объекты
+    одним запросом in_bulk вместо отдельного запроса на каждый ключ.
+    Об отсутствующих ключах сообщается одной ошибкой валидации.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.resolved = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def resolve(self, values):
+        """
+        Возвращает словарь {первичный ключ: объект} для всех переданных
+        значений. Значения некорректного типа пропускаются, их отклонит
+        валидация отдельного элемента.
+        """
+        pks = []
+        for value in values:
+            try:
+                pks.append(self.to_pk(value))
+            except serializers.ValidationError:
+                continue
+        objects = self.get_queryset().in_bulk(set(pks))
+        missing = sorted({pk for pk in pks if pk not in objects})
+        if missing:
+            self.fail(
+                'does_not_exist',
+                pk_value=', '.join(str(pk) for pk in missing)
+            )
+        return objects
+
+    def to_internal_value(self, data):
+        if self.resolved is None:
+            return super().to_internal_value(data)
+        pk = self.to_pk(data)
+        if pk not in self.resolved:
+            self.fail('does_not_exist', pk_value=pk)
+        return self.resolved[pk]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """
+    Список связанных объектов, загружаемых одним запросом.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        objects = self.child_relation.resolve(data)
+        return [
+            objects[self.child_relation.to_pk(item)] for item in data
+        ]
+
+
+class BulkRelatedListSerializer(serializers.ListSerializer):
+    """
+    Списочный сериализатор, заранее загружающий объекты для полей
+    BulkPrimaryKeyRelatedField всех элементов списка одним запросом
+    на поле.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+        fields = [
+            field for field in self.child._writable_fields
+            if isinstance(field, BulkPrimaryKeyRelatedField)
+        ]
+        try:
+            for field in fields:
+                field.resolved = field.resolve(
+                    item[field.field_name] for item in data
+                    if isinstance(item, Mapping) and field.field_name in item
+                )
+            return super().to_internal_value(data)
+        finally:
+            for field in fields:
+                field.resolved = None
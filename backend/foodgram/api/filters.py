@@ -1,7 +1,60 @@
 import django_filters
+from django.db.models import Exists, F, OuterRef
 from django_filters.widgets import BooleanWidget
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 
-from recipes.models import Ingredient, Recipe
+from api.cache import get_version
+from api.metrics import record_cache
+from api.pagination import LimitCursorPagination
+from api.search import search_recipes
+from recipes.models import Ingredient, Recipe, RecipeTag, Tag
+
+tag_ids = (None, {})
+
+
+def get_tag_ids():
+    """
+    Функция возвращающая словарь {slug тега: id}. Словарь хранится в памяти
+    процесса и читается из базы заново только при смене версии тегов в
+    кеше, которую увеличивают сигналы.
+    """
+    global tag_ids
+    version = get_version(Tag)
+    cached_version, ids = tag_ids
+    fresh = cached_version == version
+    record_cache('tag_ids', hits=fresh, misses=not fresh)
+    if not fresh:
+        ids = dict(Tag.objects.values_list('slug', 'id'))
+        tag_ids = (version, ids)
+    return ids
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
+
+
+class TagsFilter(django_filters.MultipleChoiceFilter):
+    """
+    Фильтр рецептов по slug тегов. Допустимые значения проверяются по
+    словарю тегов в памяти процесса без запроса к базе. Рецепты отбираются
+    подзапросом Exists по RecipeTag, который использует индекс (tag,
+    recipe): рецепт с несколькими выбранными тегами попадает в выдачу
+    один раз без DISTINCT.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', get_tag_choices)
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ids = get_tag_ids()
+        return qs.annotate(has_tags=Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__in=[ids[slug] for slug in value if slug in ids],
+        ))).filter(has_tags=True)
 
 
 class IngredientFilter(django_filters.FilterSet):
@@ -18,8 +71,8 @@ class IngredientFilter(django_filters.FilterSet):
 
 class ResipeFilter(django_filters.FilterSet):
     """
-    Фильтрсет для фильтрации рецептов по тэгам, нахождению в избранном и
-    нахождению в списке покупок.
+    Фильтрсет для фильтрации рецептов по тэгам, нахождению в избранном,
+    нахождению в списке покупок и полнотекстовому поиску.
     """
 
     is_favorited = django_filters.BooleanFilter(
@@ -32,18 +85,57 @@ class ResipeFilter(django_filters.FilterSet):
         method='shopping_cart_filter',
         widget=BooleanWidget
     )
-    tags = django_filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = TagsFilter()
+    search = django_filters.CharFilter(method='search_filter')
 
     def favorite_filter(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
-            return queryset.filter(favorite__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def shopping_cart_filter(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
-            return Recipe.objects.filter(shoppinglist__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
+    def search_filter(self, queryset, name, value):
+        # Пажинация по ключу упорядочивает рецепты по id, и порядок по
+        # релевантности потерялся бы без ошибки.
+        if LimitCursorPagination.cursor_query_param in self.request.GET:
+            raise ValidationError({
+                'search': 'Поиск не поддерживает пажинацию по ключу, '
+                          'используйте параметр page.'
+            })
+        return search_recipes(queryset, value)
+
     class Meta:
         model = Recipe
         fields = ('tags', 'author', )
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """
+    Сортировка рецептов по параметру ordering. Значение popular выводит
+    рецепты по популярности, рассчитанной командой update_popularity,
+    рецепты без оценки идут в конце списка.
+    Без параметра порядок задают остальные фильтры, пажинации по ключу
+    передаётся сортировка по id.
+    """
+
+    orderings = {
+        'popular': ('-popularity_score', '-id'),
+    }
+    default_ordering = ('-id',)
+
+    def get_ordering(self, request, queryset, view):
+        return self.orderings.get(
+            request.query_params.get(self.ordering_param),
+            self.default_ordering
+        )
+
+    def filter_queryset(self, request, queryset, view):
+        if request.query_params.get(self.ordering_param) != 'popular':
+            return queryset
+        return queryset.annotate(
+            popularity_score=F('popularity__score')
+        ).order_by(F('popularity_score').desc(nulls_last=True), '-id')
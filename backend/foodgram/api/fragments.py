@@ -0,0 +1,68 @@
+import hashlib
+
+from django.core.cache import cache
+
+from api.cache import RESPONSE_CACHE_TIMEOUT
+from api.metrics import record_cache
+from api.serializers import ReadRecipeSerializer, RecipeFragmentSerializer
+
+
+def fragment_key(request, stamp):
+    """
+    Ключ фрагмента включает метку изменения рецепта, поэтому правка
+    рецепта, его ингредиентов, тегов или профиля автора делает прежний
+    фрагмент недоступным без явного удаления. Адрес сайта входит в ключ,
+    так как ссылка на изображение в представлении абсолютная.
+    """
+    host = hashlib.md5(request.build_absolute_uri('/').encode()).hexdigest()
+    return (
+        f'recipe_fragment:{stamp["id"]}:'
+        f'{stamp["updated_at"].timestamp()}:{host}'
+    )
+
+
+def render_recipes(stamps, queryset, context):
+    """
+    Функция формирующая представления рецептов из закешированных
+    фрагментов и признаков пользователя из stamps. Фрагменты загружаются
+    одним get_many, недостающие сериализуются одним запросом к queryset
+    и сохраняются в кеш. Рецепты, удалённые после чтения stamps,
+    пропускаются.
+    """
+    request = context['request']
+    keys = {stamp['id']: fragment_key(request, stamp) for stamp in stamps}
+    fragments = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in fragments]
+    record_cache('recipe_fragment', hits=len(fragments), misses=len(missing))
+    if missing:
+        created = {
+            keys[recipe['id']]: recipe
+            for recipe in RecipeFragmentSerializer(
+                queryset.filter(pk__in=missing), many=True, context=context
+            ).data
+        }
+        cache.set_many(created, RESPONSE_CACHE_TIMEOUT)
+        fragments.update(created)
+    return [
+        merge_recipe(fragments[keys[stamp['id']]], stamp)
+        for stamp in stamps
+        if keys[stamp['id']] in fragments
+    ]
+
+
+def merge_recipe(fragment, stamp):
+    """
+    Функция добавляющая к фрагменту рецепта признаки, зависящие от
+    пользователя, в порядке полей ReadRecipeSerializer.
+    """
+    flags = {
+        'is_favorited': stamp['is_favorited'],
+        'is_in_shopping_cart': stamp['is_in_shopping_cart'],
+        'author': dict(
+            fragment['author'], is_subscribed=stamp['author_is_subscribed']
+        ),
+    }
+    return {
+        field: flags[field] if field in flags else fragment[field]
+        for field in ReadRecipeSerializer.Meta.fields
+    }
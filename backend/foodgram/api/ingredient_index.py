@@ -0,0 +1,88 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+from api.cache import get_version
+from api.metrics import record_cache
+from recipes.models import Ingredient
+
+
+def fold(text):
+    """
+    Функция приводящая строку к виду для регистронезависимого сравнения,
+    в том числе для кириллицы: буква «ё» приравнивается к «е».
+    """
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения по названию.
+    Хранит отсортированный массив нормализованных названий, поиск по
+    началу названия выполняется бинарным поиском. Индекс строится при
+    первом обращении и перестраивается при смене версии ингредиентов в
+    кеше, которую увеличивают сигналы, так что изменения видят все
+    процессы, использующие общий кеш.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def _build(self, version):
+        with self._lock:
+            if self._index is None or self._index[0] != version:
+                entries = sorted(
+                    (fold(ingredient['name']), ingredient['id'], ingredient)
+                    for ingredient in Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit'
+                    ).iterator()
+                )
+                keys = [entry[0] for entry in entries]
+                offsets = []
+                offset = 0
+                for key in keys:
+                    offsets.append(offset)
+                    offset += len(key) + 1
+                self._index = (
+                    version,
+                    keys,
+                    [entry[2] for entry in entries],
+                    '\n'.join(keys),
+                    offsets,
+                )
+            return self._index
+
+    def search(self, name):
+        """
+        Возвращает ингредиенты, название которых начинается с name, а
+        следом ингредиенты, содержащие name в середине названия.
+        """
+        version = get_version(Ingredient)
+        index = self._index
+        fresh = index is not None and index[0] == version
+        record_cache('ingredient_index', hits=fresh, misses=not fresh)
+        if not fresh:
+            index = self._build(version)
+        _, keys, items, haystack, offsets = index
+        prefix = fold(name)
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        substring_matches = []
+        found = haystack.find(prefix)
+        while found != -1:
+            position = bisect_right(offsets, found) - 1
+            if not start <= position < end:
+                substring_matches.append(items[position])
+            if position + 1 == len(offsets):
+                break
+            found = haystack.find(prefix, offsets[position + 1])
+        return items[start:end] + substring_matches
+
+
+ingredient_index = IngredientIndex()
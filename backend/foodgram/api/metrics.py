@@ -0,0 +1,298 @@
+import fcntl
+import glob
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+FLUSH_INTERVAL = 1.0
+AGGREGATE_FILE = 'metrics_aggregate.json'
+LOCK_FILE = 'metrics.lock'
+
+METRICS = {
+    'foodgram_request_duration_seconds': (
+        'histogram', 'Время обработки запроса', LATENCY_BUCKETS,
+    ),
+    'foodgram_request_queries': (
+        'histogram', 'Количество SQL запросов на запрос', QUERY_BUCKETS,
+    ),
+    'foodgram_request_errors_total': (
+        'counter', 'Количество ответов с ошибкой', None,
+    ),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кешам и индексам', None,
+    ),
+}
+CACHE_HIT_RATIO = 'foodgram_cache_hit_ratio'
+
+
+class MetricsStore:
+    """
+    Хранилище метрик процесса. Запись метрики - увеличение значений в
+    словаре под коротко удерживаемой блокировкой процесса, без обращений к
+    другим процессам. Не чаще раза в FLUSH_INTERVAL секунд значения
+    записываются в собственный файл процесса в общем каталоге, откуда
+    их собирает эндпойнт метрик, так что данные всех воркеров gunicorn
+    суммируются. Файлы завершившихся процессов переносятся в общий файл
+    AGGREGATE_FILE функцией merge_process, чтобы суммы не уменьшались.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed = 0.0
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[(name, labels)] += value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        index = bisect_left(buckets, value)
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = [0] * (len(buckets) + 1) + [0.0]
+                self.histograms[(name, labels)] = histogram
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            data = {
+                'counters': [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, labels, list(values)]
+                    for (name, labels), values in self.histograms.items()
+                ],
+            }
+            self.flushed = time.monotonic()
+        write_metrics(self.directory, process_file(os.getpid()), data)
+
+    def collect(self):
+        """
+        Суммирует метрики всех процессов и возвращает их в текстовом
+        формате Prometheus.
+        """
+        self.flush()
+        counters = defaultdict(float)
+        histograms = {}
+        with locked(self.directory, fcntl.LOCK_SH):
+            for path in glob.glob(
+                os.path.join(self.directory, 'metrics_*.json')
+            ):
+                add_metrics(counters, histograms, read_metrics(path))
+        return format_metrics(counters, histograms)
+
+
+def process_file(pid):
+    """
+    Имя файла метрик процесса. Имя хоста отличает процессы разных
+    контейнеров с общим каталогом метрик.
+    """
+    return f'metrics_{socket.gethostname()}_{pid}.json'
+
+
+@contextmanager
+def locked(directory, operation):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, operation)
+        yield
+
+
+def read_metrics(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_metrics(directory, name, data):
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as file:
+        json.dump(data, file)
+    os.replace(temp_path, os.path.join(directory, name))
+
+
+def add_metrics(counters, histograms, data):
+    if data is None:
+        return
+    for name, labels, value in data['counters']:
+        counters[(name, freeze(labels))] += value
+    for name, labels, values in data['histograms']:
+        key = (name, freeze(labels))
+        if key in histograms:
+            histograms[key] = [
+                left + right for left, right in zip(histograms[key], values)
+            ]
+        else:
+            histograms[key] = values
+
+
+def merge_process(directory, pid=None):
+    """
+    Переносит счётчики и гистограммы завершившегося процесса pid в общий
+    файл AGGREGATE_FILE и удаляет файл процесса, как multiprocess режим
+    prometheus_client. Суммы при этом не уменьшаются, и Prometheus не
+    принимает перезапуск воркера за сброс счётчиков. Без pid переносятся
+    все файлы этого хоста - остатки процессов, завершившихся вместе с
+    предыдущим запуском gunicorn. Метрики-значения (доля попаданий в кеш)
+    вычисляются при сборе и в файлах не хранятся, переносить их не нужно.
+    Вызывается из хуков gunicorn в gunicorn.conf.py.
+    """
+    if pid is None:
+        paths = glob.glob(os.path.join(directory, process_file('*')))
+    else:
+        paths = [os.path.join(directory, process_file(pid))]
+    with locked(directory, fcntl.LOCK_EX):
+        counters = defaultdict(float)
+        histograms = {}
+        add_metrics(counters, histograms, read_metrics(
+            os.path.join(directory, AGGREGATE_FILE)
+        ))
+        merged = []
+        for path in paths:
+            data = read_metrics(path)
+            if data is not None:
+                add_metrics(counters, histograms, data)
+                merged.append(path)
+        if not merged:
+            return
+        write_metrics(directory, AGGREGATE_FILE, {
+            'counters': [
+                [name, labels, value]
+                for (name, labels), value in counters.items()
+            ],
+            'histograms': [
+                [name, labels, values]
+                for (name, labels), values in histograms.items()
+            ],
+        })
+        for path in merged:
+            os.remove(path)
+
+
+def freeze(labels):
+    return tuple(tuple(label) for label in labels)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+                '\n', r'\n'
+            )
+        ) for name, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def format_histogram(name, buckets, histograms):
+    lines = []
+    for (metric, labels), values in sorted(histograms.items()):
+        if metric != name:
+            continue
+        total = 0
+        for bound, count in zip(buckets + ('+Inf',), values[:-1]):
+            total += count
+            lines.append('{}_bucket{} {}'.format(
+                name, format_labels(labels + (('le', str(bound)),)), total
+            ))
+        lines.append(
+            f'{name}_sum{format_labels(labels)} {format_value(values[-1])}'
+        )
+        lines.append(f'{name}_count{format_labels(labels)} {total}')
+    return lines
+
+
+def format_hit_ratios(counters):
+    lines = [
+        f'# HELP {CACHE_HIT_RATIO} Доля попаданий в кеш',
+        f'# TYPE {CACHE_HIT_RATIO} gauge',
+    ]
+    layers = defaultdict(dict)
+    for (metric, labels), value in counters.items():
+        if metric == 'foodgram_cache_requests_total':
+            labels = dict(labels)
+            layers[labels['layer']][labels['result']] = value
+    for layer, results in sorted(layers.items()):
+        total = results.get('hit', 0) + results.get('miss', 0)
+        if total:
+            lines.append('{}{} {}'.format(
+                CACHE_HIT_RATIO, format_labels((('layer', layer),)),
+                format_value(results.get('hit', 0) / total)
+            ))
+    return lines
+
+
+def format_metrics(counters, histograms):
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            lines.extend(format_histogram(name, buckets, histograms))
+            continue
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(
+                    f'{name}{format_labels(labels)} {format_value(value)}'
+                )
+    lines.extend(format_hit_ratios(counters))
+    return '\n'.join(lines) + '\n'
+
+
+store = (
+    MetricsStore(settings.METRICS_DIR)
+    if getattr(settings, 'METRICS_DIR', '') else None
+)
+
+
+def record_cache(layer, hits=0, misses=0):
+    """
+    Функция учитывающая попадания и промахи кеша или индекса layer.
+    Если сбор метрик выключен, ничего не делает.
+    """
+    if store is None:
+        return
+    if hits:
+        store.inc(
+            'foodgram_cache_requests_total',
+            (('layer', layer), ('result', 'hit')), hits
+        )
+    if misses:
+        store.inc(
+            'foodgram_cache_requests_total',
+            (('layer', layer), ('result', 'miss')), misses
+        )
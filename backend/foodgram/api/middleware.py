@@ -0,0 +1,135 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from api.metrics import store
+from api.timing import RequestTimings, current_timings
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware, добавляющий к ответу заголовок Server-Timing с временем
+    SQL запросов, сериализации и отрисовки и записывающий медленные
+    запросы в лог в формате JSON. Включается настройкой SERVER_TIMING,
+    выключенный middleware не участвует в обработке запросов.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVER_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_request_ms = getattr(settings, 'SLOW_REQUEST_MS', 500)
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        total = time.perf_counter() - timings.started
+        self.add_header(response, timings, total)
+        if total * 1000 >= self.slow_request_ms:
+            self.log(request, response, timings, total)
+        return response
+
+    def process_template_response(self, request, response):
+        timings = current_timings.get()
+        started = time.perf_counter()
+
+        def rendered(response):
+            timings.durations['render'] += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def add_header(self, response, timings, total):
+        durations = timings.durations
+        duplicates = timings.duplicates()
+        metrics = [
+            f'db;dur={durations["db"] * 1000:.1f};'
+            f'desc="{timings.query_count} queries, '
+            f'{sum(duplicates.values())} duplicated"',
+            f'serialize;dur={durations["serialize"] * 1000:.1f}',
+            f'render;dur={durations["render"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ]
+        if not response.streaming:
+            metrics.append(f'size;desc="{len(response.content)} bytes"')
+        response['Server-Timing'] = ', '.join(metrics)
+
+    def log(self, request, response, timings, total):
+        durations = timings.durations
+        logger.warning(json.dumps({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(durations['db'] * 1000, 1),
+            'queries': timings.query_count,
+            'serialize_ms': round(durations['serialize'] * 1000, 1),
+            'render_ms': round(durations['render'] * 1000, 1),
+            'size': (
+                None if response.streaming else len(response.content)
+            ),
+            'duplicate_queries': [
+                {'sql': sql, 'count': count}
+                for sql, count in sorted(
+                    timings.duplicates().items(),
+                    key=lambda item: -item[1]
+                )
+            ],
+        }, ensure_ascii=False))
+
+
+class MetricsMiddleware:
+    """
+    Middleware, собирающий гистограммы времени ответа и количества SQL
+    запросов по представлениям и количество ответов с ошибками.
+    Включается настройкой METRICS_DIR - каталогом, общим для воркеров.
+    """
+
+    def __init__(self, get_response):
+        if store is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        labels = (
+            ('view', match.view_name if match else 'unmatched'),
+            ('method', request.method),
+        )
+        store.observe('foodgram_request_duration_seconds', labels, duration)
+        store.observe('foodgram_request_queries', labels, queries[0])
+        if response.status_code >= 400:
+            store.inc(
+                'foodgram_request_errors_total',
+                labels + (('status', str(response.status_code)),)
+            )
+        store.maybe_flush()
+        return response
@@ -1,9 +1,209 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor, CursorPagination, PageNumberPagination,
+)
+
+from api.metrics import record_cache
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пажинатор, который для списков без фильтров по таблицам PostgreSQL
+    больше estimate_threshold строк не выполняет COUNT(*) на каждый запрос,
+    а берёт количество из статистики планировщика. Статистика кешируется
+    на count_cache_timeout секунд. Для небольших таблиц, других баз данных
+    и списков с фильтрами количество точное.
+    """
+
+    count_cache_timeout = 60
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or queryset.query.where:
+            return super().count
+        estimate = self.estimate_count(queryset.model._meta.db_table)
+        if estimate is None or estimate < self.estimate_threshold:
+            return super().count
+        return estimate
+
+    def estimate_count(self, table):
+        if connection.vendor != 'postgresql':
+            return None
+        key = f'pagination_count:{table}'
+        estimate = cache.get(key)
+        record_cache('pagination_count', hits=estimate is not None,
+                     misses=estimate is None)
+        if estimate is None:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE relname = %s',
+                    [table]
+                )
+                row = cursor.fetchone()
+            estimate = 0 if row is None else row[0]
+            cache.set(key, estimate, self.count_cache_timeout)
+        return estimate
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    Пажинация по ключу (keyset): следующая страница выбирается условием
+    по id без OFFSET и без подсчёта общего количества объектов.
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = '-id'
+    nulls_last_fields = ('popularity_score',)
+    nulls_last_field = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Сортировка по полю, которое может быть пустым (оценка
+        популярности), пажинируется по паре (значение, id): курсор по
+        одному полю не различает тысячи рецептов без оценки.
+        """
+        field = self.get_ordering(request, queryset, view)[0].lstrip('-')
+        if field not in self.nulls_last_fields:
+            self.nulls_last_field = None
+            return super().paginate_queryset(queryset, request, view)
+        self.nulls_last_field = field
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is not None and self.cursor.position is not None:
+            queryset = queryset.filter(self.following(self.cursor.position))
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def following(self, position):
+        """
+        Условие на строки после позиции курсора value:id при сортировке по
+        убыванию значения, затем id, с пустыми значениями в конце.
+        """
+        field = self.nulls_last_field
+        value, _, pk = position.partition(':')
+        try:
+            pk = int(pk)
+            value = float(value) if value else None
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            return Q(**{f'{field}__isnull': True, 'id__lt': pk})
+        return (
+            Q(**{f'{field}__lt': value})
+            | Q(**{field: value, 'id__lt': pk})
+            | Q(**{f'{field}__isnull': True})
+        )
+
+    def get_next_link(self):
+        if self.nulls_last_field is None:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        row = self.page[-1]
+        value = row[self.nulls_last_field]
+        position = f'{"" if value is None else repr(value)}:{row["id"]}'
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=position)
+        )
+
+    def get_previous_link(self):
+        if self.nulls_last_field is None:
+            return super().get_previous_link()
+        return None
+
+
+class MergedCursorPagination(LimitCursorPagination):
+    """
+    Пажинация по ключу для списка, собранного из нескольких источников
+    id: из каждого источника выбирается страница по убыванию id, страницы
+    сливаются. Поддерживается только переход к следующей странице.
+    """
+
+    def paginate_sources(self, sources, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        position = None
+        if self.cursor is not None:
+            try:
+                position = int(self.cursor.position)
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        ids = set()
+        for queryset, field in sources:
+            if position is not None:
+                queryset = queryset.filter(**{f'{field}__lt': position})
+            ids.update(queryset.order_by(f'-{field}').values_list(
+                field, flat=True
+            )[:self.page_size + 1])
+        ids = sorted(ids, reverse=True)
+        self.has_next = len(ids) > self.page_size
+        self.page_ids = ids[:self.page_size]
+        return self.page_ids
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.page_ids[-1])
+        )
+
+    def get_previous_link(self):
+        return None
 
 
 class LimitPagePagination(PageNumberPagination):
     """
     Переопределения имени поля в стандартном пажинаторе, для корректной работы
-    с frontend-частью проекта
+    с frontend-частью проекта. При наличии в запросе параметра cursor
+    (в том числе пустого) queryset пажинируется по ключу.
     """
     page_size_query_param = 'limit'
+    django_paginator_class = EstimatedCountPaginator
+    cursor_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_pagination = LimitCursorPagination()
+        if (
+            isinstance(queryset, QuerySet)
+            and cursor_pagination.cursor_query_param in request.query_params
+        ):
+            self.cursor_pagination = cursor_pagination
+            return cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.to_html()
+        return super().to_html()
+
+
+class DefaultLimitPagePagination(LimitPagePagination):
+    """
+    Пажинатор, который без параметра limit возвращает первую страницу из
+    page_size объектов, а не весь список без пажинации.
+    """
+    page_size = 6
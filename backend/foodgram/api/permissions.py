@@ -1,3 +1,6 @@
+from ipaddress import ip_address, ip_network
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -7,7 +10,7 @@ class IsAuthor(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        return request.user and request.user == obj.author
+        return request.user and request.user.pk == obj.author_id
 
 
 class ReadOnly(permissions.BasePermission):
@@ -20,3 +23,37 @@ class ReadOnly(permissions.BasePermission):
 
     def has_permission(self, request, view):
         return request.method in permissions.SAFE_METHODS
+
+
+def get_client_ip(request):
+    """
+    Функция возвращающая адрес клиента. За прокси REMOTE_ADDR - адрес
+    самого прокси, поэтому для запросов от адресов и сетей из настройки
+    TRUSTED_PROXIES адрес берётся из заголовка X-Real-IP, который
+    выставляет nginx. От остальных адресов заголовок не принимается, чтобы
+    клиент не мог подставить его сам.
+    """
+    address = request.META.get('REMOTE_ADDR', '')
+    try:
+        trusted = any(
+            ip_address(address) in ip_network(proxy, strict=False)
+            for proxy in settings.TRUSTED_PROXIES
+        )
+    except ValueError:
+        return address
+    if trusted:
+        return request.META.get('HTTP_X_REAL_IP', address)
+    return address
+
+
+class IsStaffOrInternal(permissions.BasePermission):
+    """
+    Пермишенс класс предоставляющий доступ сотрудникам и запросам с
+    адресов из настройки METRICS_ALLOWED_IPS
+    """
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user and request.user.is_staff
+            or get_client_ip(request) in settings.METRICS_ALLOWED_IPS
+        )
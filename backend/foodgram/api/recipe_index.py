@@ -0,0 +1,158 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from api.cache import RESPONSE_CACHE_TIMEOUT, bump_version, get_version
+from api.metrics import record_cache
+from recipes.models import RecipeIngredient
+
+
+def change_key(version):
+    return f'recipe_index_change:{version}'
+
+
+def without(postings, value):
+    position = bisect_left(postings, value)
+    if position < len(postings) and postings[position] == value:
+        postings = postings[:position] + postings[position + 1:]
+    return postings
+
+
+def with_value(postings, value):
+    position = bisect_left(postings, value)
+    if position < len(postings) and postings[position] == value:
+        return postings
+    return postings[:position] + array('l', [value]) + postings[position:]
+
+
+class RecipeIndex:
+    """
+    Инвертированный индекс ингредиент -> рецепты в памяти процесса для
+    подбора рецептов по имеющимся ингредиентам. Для каждого ингредиента
+    хранится отсортированный массив id рецептов, для каждого рецепта -
+    его ингредиенты. Изменения рецептов применяются к индексу
+    инкрементально; другие процессы узнают о них по версии в общем кеше
+    и дочитывают из базы только изменившиеся рецепты.
+    """
+
+    max_replay = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def _build(self, version):
+        groups = defaultdict(list)
+        recipes = defaultdict(tuple)
+        for recipe, ingredient in RecipeIngredient.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('recipe_id', 'ingredient_id').iterator():
+            groups[ingredient].append(recipe)
+            recipes[recipe] += (ingredient,)
+        postings = {
+            ingredient: array('l', recipe_ids)
+            for ingredient, recipe_ids in groups.items()
+        }
+        return version, postings, dict(recipes)
+
+    def _apply(self, index, recipe, ingredients):
+        _, postings, recipes = index
+        ingredients = tuple(sorted(set(ingredients)))
+        old = set(recipes.get(recipe, ()))
+        for ingredient in old.difference(ingredients):
+            postings[ingredient] = without(postings[ingredient], recipe)
+        for ingredient in set(ingredients).difference(old):
+            postings[ingredient] = with_value(
+                postings.get(ingredient, array('l')), recipe
+            )
+        if ingredients:
+            recipes[recipe] = ingredients
+        else:
+            recipes.pop(recipe, None)
+
+    def _replay(self, index, version):
+        """
+        Применяет к индексу изменения, записанные другими процессами
+        после его версии. Возвращает False, если часть изменений уже
+        вытеснена из кеша и индекс нужно построить заново.
+        """
+        if not 0 < version - index[0] <= self.max_replay:
+            return False
+        keys = [change_key(number) for number in range(index[0] + 1,
+                                                       version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return False
+        ingredients = defaultdict(list)
+        for recipe, ingredient in RecipeIngredient.objects.filter(
+            recipe__in=set(changes.values())
+        ).values_list('recipe_id', 'ingredient_id'):
+            ingredients[recipe].append(ingredient)
+        for recipe in set(changes.values()):
+            self._apply(index, recipe, ingredients[recipe])
+        return True
+
+    def _sync(self):
+        version = get_version(RecipeIngredient)
+        index = self._index
+        fresh = index is not None and index[0] == version
+        record_cache('recipe_index', hits=fresh, misses=not fresh)
+        if fresh:
+            return index
+        with self._lock:
+            index = self._index
+            if index is None or index[0] != version:
+                if index is not None and self._replay(index, version):
+                    index = (version, index[1], index[2])
+                else:
+                    index = self._build(version)
+                self._index = index
+            return index
+
+    def update(self, recipe, ingredients):
+        """
+        Записывает новый набор ингредиентов рецепта после фиксации
+        транзакции. Пустой набор удаляет рецепт из индекса.
+        """
+        ingredients = tuple(ingredients)
+
+        def apply():
+            version = bump_version(RecipeIngredient)
+            cache.set(change_key(version), recipe, RESPONSE_CACHE_TIMEOUT)
+            with self._lock:
+                index = self._index
+                if index is not None and index[0] == version - 1:
+                    self._apply(index, recipe, ingredients)
+                    self._index = (version, index[1], index[2])
+
+        transaction.on_commit(apply)
+
+    def search(self, ingredients, max_missing=None):
+        """
+        Возвращает список пар (id рецепта, число недостающих ингредиентов)
+        для рецептов, в которых есть хотя бы один из переданных
+        ингредиентов. Рецепты упорядочены по числу недостающих
+        ингредиентов, затем по числу совпавших и от новых к старым.
+        """
+        _, postings, recipes = self._sync()
+        matched = Counter()
+        for ingredient in set(ingredients):
+            matched.update(postings.get(ingredient, ()))
+        results = []
+        for recipe, count in matched.items():
+            missing = len(recipes.get(recipe, ())) - count
+            if max_missing is None or missing <= max_missing:
+                results.append((missing, -count, -recipe))
+        results.sort()
+        return [(-recipe, missing) for missing, _, recipe in results]
+
+
+recipe_index = RecipeIndex()
@@ -0,0 +1,29 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class PlainTextRenderer(BaseRenderer):
+    """
+    Рендерер для выгрузки файлов в текстовом виде. Используется
+    для согласования формата по параметру format, а также для вывода
+    сообщений об ошибках в выбранном формате.
+    """
+
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """
+    Рендерер для выгрузки файлов в формате CSV.
+    """
+
+    media_type = 'text/csv'
+    format = 'csv'
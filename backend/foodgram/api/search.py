@@ -0,0 +1,172 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+POSTGRESQL_MATCH = (
+    "recipes_recipe.search_vector @@ plainto_tsquery('russian', %s)"
+)
+POSTGRESQL_RANK = (
+    "ts_rank(recipes_recipe.search_vector, plainto_tsquery('russian', %s))"
+)
+SQLITE_RANK = '-bm25(recipes_recipe_fts, 10.0, 1.0)'
+# Унарный плюс не даёт SQLite искать в FTS5 по rowid для каждой строки
+# рецептов: MATCH выполняется один раз, и по нему соединяются рецепты.
+SQLITE_JOIN = '+recipes_recipe_fts.rowid = recipes_recipe.id'
+SQLITE_MATCH = 'recipes_recipe_fts MATCH %s'
+
+# Триггеры, которые поддерживают поисковый индекс (миграция 0008). На
+# SQLite Django пересоздаёт таблицу при изменении её полей в следующих
+# миграциях, и триггеры удаляются вместе со старой таблицей, поэтому они
+# проверяются и восстанавливаются после каждой миграции.
+SEARCH_TRIGGERS = {
+    'postgresql': {
+        'recipes_recipe_search_vector_update': """
+        CREATE TRIGGER recipes_recipe_search_vector_update
+        BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+        FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector()
+        """,
+    },
+    'sqlite': {
+        'recipes_recipe_fts_insert': """
+        CREATE TRIGGER recipes_recipe_fts_insert
+        AFTER INSERT ON recipes_recipe
+        BEGIN
+            INSERT INTO recipes_recipe_fts (rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+        """,
+        'recipes_recipe_fts_delete': """
+        CREATE TRIGGER recipes_recipe_fts_delete
+        AFTER DELETE ON recipes_recipe
+        BEGIN
+            INSERT INTO recipes_recipe_fts (
+                recipes_recipe_fts, rowid, name, text
+            )
+            VALUES ('delete', old.id, old.name, old.text);
+        END
+        """,
+        'recipes_recipe_fts_update': """
+        CREATE TRIGGER recipes_recipe_fts_update
+        AFTER UPDATE OF name, text ON recipes_recipe
+        BEGIN
+            INSERT INTO recipes_recipe_fts (
+                recipes_recipe_fts, rowid, name, text
+            )
+            VALUES ('delete', old.id, old.name, old.text);
+            INSERT INTO recipes_recipe_fts (rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+        """,
+    },
+}
+SEARCH_REBUILD = {
+    'postgresql': """
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(text, '')), 'B')
+    """,
+    'sqlite': "INSERT INTO recipes_recipe_fts (recipes_recipe_fts) "
+              "VALUES ('rebuild')",
+}
+EXISTING_TRIGGERS = {
+    'postgresql': 'SELECT tgname FROM pg_trigger WHERE NOT tgisinternal '
+                  "AND tgrelid = 'recipes_recipe'::regclass",
+    'sqlite': "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+              "AND tbl_name = 'recipes_recipe'",
+}
+
+
+def fts5_query(query):
+    """
+    Функция преобразующая поисковую строку в запрос FTS5: каждое слово
+    экранируется и ищется по префиксу, слова объединяются через AND.
+    """
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""'))
+        for word in re.findall(r'\w+', query)
+    )
+
+
+def search_recipes(queryset, query):
+    """
+    Функция фильтрующая рецепты по полнотекстовому запросу и сортирующая их
+    по релевантности: совпадение в названии весит больше, чем в описании.
+    На PostgreSQL используется поле search_vector с GIN индексом и русским
+    словарём, на SQLite - виртуальная таблица FTS5. Обе поддерживаются
+    триггерами базы данных.
+    """
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        queryset = queryset.annotate(
+            search_match=RawSQL(
+                POSTGRESQL_MATCH, (query,), output_field=BooleanField()
+            ),
+            search_rank=RawSQL(
+                POSTGRESQL_RANK, (query,), output_field=FloatField()
+            ),
+        ).filter(search_match=True)
+    elif vendor == 'sqlite':
+        query = fts5_query(query)
+        if not query:
+            return queryset.none()
+        queryset = queryset.extra(
+            select={'search_rank': SQLITE_RANK},
+            tables=['recipes_recipe_fts'],
+            where=[SQLITE_JOIN, SQLITE_MATCH],
+            params=[query],
+        )
+    else:
+        return queryset.filter(name__icontains=query)
+    return queryset.order_by('-search_rank', '-id')
+
+
+def search_installed(cursor):
+    """
+    Функция проверяющая, что миграция поискового индекса применена:
+    есть таблица FTS5 на SQLite или поле search_vector на PostgreSQL.
+    """
+    introspection = connection.introspection
+    if connection.vendor == 'sqlite':
+        return 'recipes_recipe_fts' in introspection.table_names(cursor)
+    return 'search_vector' in {
+        column.name for column in introspection.get_table_description(
+            cursor, 'recipes_recipe'
+        )
+    }
+
+
+def missing_search_triggers():
+    """
+    Функция возвращающая имена отсутствующих триггеров поискового индекса.
+    """
+    triggers = SEARCH_TRIGGERS.get(connection.vendor)
+    if triggers is None:
+        return []
+    with connection.cursor() as cursor:
+        if not search_installed(cursor):
+            return []
+        cursor.execute(EXISTING_TRIGGERS[connection.vendor])
+        existing = {row[0] for row in cursor.fetchall()}
+    return sorted(set(triggers) - existing)
+
+
+def restore_search_index(rebuild=False):
+    """
+    Функция создающая отсутствующие триггеры поискового индекса и
+    перестраивающая индекс, если триггеров не было (изменения рецептов за
+    это время в индекс не попали) или передан rebuild. Возвращает имена
+    созданных триггеров.
+    """
+    missing = missing_search_triggers()
+    vendor = connection.vendor
+    if vendor not in SEARCH_REBUILD or not (missing or rebuild):
+        return missing
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not search_installed(cursor):
+            return missing
+        for name in missing:
+            cursor.execute(SEARCH_TRIGGERS[vendor][name])
+        cursor.execute(SEARCH_REBUILD[vendor])
+    return missing
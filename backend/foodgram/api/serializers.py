@@ -1,20 +1,27 @@
 import re
 
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
 from django.forms import ValidationError
+from django.utils.functional import cached_property
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, validators
 
-from api.utils import add_ingredients_and_tags
+from api.fields import BulkPrimaryKeyRelatedField, BulkRelatedListSerializer
+from api.timing import TimedSerializerMixin
+from api.utils import (
+    add_ingredients_and_tags, annotate_recipe_flags, get_recipe_read_queryset,
+    get_recipes_limit, update_ingredients_and_tags,
+    update_shopping_list_totals,
+)
 from recipes.models import (
-    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, ShoppingList,
-    Tag,
+    Ingredient, Recipe, RecipeIngredient, ShoppingList, Tag,
 )
 from users.models import Follow, User
 
 
-class ModifiedDjoserUserSerializer(UserSerializer):
+class ModifiedDjoserUserSerializer(TimedSerializerMixin, UserSerializer):
     """
     Сериализатор для модели User. Наследуется от сериализатора из
     библиотеки Djoser, расширен полем отображающим статус подписки.
@@ -28,6 +35,8 @@ class ModifiedDjoserUserSerializer(UserSerializer):
                   'is_subscribed',)
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -35,7 +44,7 @@ class ModifiedDjoserUserSerializer(UserSerializer):
         )
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор ингредиентов.
     """
@@ -45,7 +54,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('__all__')
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор тэгов.
     """
@@ -64,7 +73,7 @@ class RecipeIngredientsSerializer(serializers.ModelSerializer):
     Сериализатор промежуточной модели связующий ингредиенты и рецепты.
     """
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(),
         source='ingredient'
     )
@@ -76,49 +85,45 @@ class RecipeIngredientsSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'name', 'amount', 'measurement_unit')
+        list_serializer_class = BulkRelatedListSerializer
 
 
 class WriteRecipeSerializer(serializers.ModelSerializer):
     """
     Сериализатор для создания рецептов.
     """
-    author = serializers.SerializerMethodField()
     ingredients = RecipeIngredientsSerializer(
         many=True,
         source='recipeingredient_set'
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True
     )
     image = Base64ImageField()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'author', 'tags', 'name', 'text', 'ingredients',
-                  'is_favorited', 'is_in_shopping_cart', 'image',
+        fields = ('id', 'tags', 'name', 'text', 'ingredients', 'image',
                   'cooking_time')
 
-    def get_author(self, obj):
-        serializer = ModifiedDjoserUserSerializer(read_only=True)
-        return serializer.data
-
-    def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and Favorite.objects.filter(user=user, recipe=obj).exists()
-        )
-
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and ShoppingList.objects.filter(user=user, recipe=obj).exists()
-        )
-
+    def to_representation(self, instance):
+        """
+        Рецепт отображается сериализатором чтения. Если у объекта нет
+        признаков пользователя, он загружается заново queryset-ом чтения,
+        чтобы количество запросов не зависело от числа ингредиентов.
+        """
+        if not hasattr(instance, 'is_favorited'):
+            instance = annotate_recipe_flags(
+                get_recipe_read_queryset(), self.context['request'].user
+            ).get(pk=instance.pk)
+        return self.read_serializer.to_representation(instance)
+
+    @cached_property
+    def read_serializer(self):
+        return ReadRecipeSerializer(context=self.context)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('recipeingredient_set')
         tags = validated_data.pop('tags')
@@ -126,29 +131,33 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
         add_ingredients_and_tags(recipe, ingredients, tags)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('recipeingredient_set')
-        tags = validated_data.pop('tags')
+        ingredients = validated_data.pop('recipeingredient_set', None)
+        tags = validated_data.pop('tags', None)
         super().update(instance, validated_data)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        RecipeTag.objects.filter(recipe=instance).delete()
-        add_ingredients_and_tags(instance, ingredients, tags)
+        update_shopping_list_totals(
+            ShoppingList.objects.filter(
+                recipe=instance
+            ).values_list('user', flat=True),
+            update_ingredients_and_tags(instance, ingredients, tags)
+        )
         return instance
 
     def validate_ingredients(self, value):
-        used_ingredients = []
+        used_ingredients = set()
         for ing in value:
-            if ing['ingredient'] in used_ingredients:
+            if ing['ingredient'].id in used_ingredients:
                 wrong_ingredient = ing['ingredient'].name
                 raise serializers.ValidationError(
                     f'Задайте ингредиент {wrong_ingredient} одной строкой с'
                     ' общим количеством'
                 )
-            used_ingredients.append(ing['ingredient'])
+            used_ingredients.add(ing['ingredient'].id)
         return value
 
 
-class ReadRecipeSerializer(serializers.ModelSerializer):
+class ReadRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор для отображения рецептов.
     """
@@ -160,8 +169,8 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
     )
     tags = TagSerializer(many=True)
     image = Base64ImageField()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -169,22 +178,44 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
                   'is_favorited', 'is_in_shopping_cart', 'image',
                   'cooking_time')
 
-    def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and Favorite.objects.filter(user=user, recipe=obj).exists()
-        )
+    def to_representation(self, instance):
+        """
+        Признак подписки на автора вычисляется аннотацией в queryset рецептов
+        и передаётся в сериализатор пользователя через объект автора.
+        """
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
 
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and ShoppingList.objects.filter(user=user, recipe=obj).exists()
-        )
 
+class AuthorFragmentSerializer(ModifiedDjoserUserSerializer):
+    """
+    Сериализатор автора рецепта без полей, зависящих от пользователя.
+    """
+
+    is_subscribed = None
+
+    class Meta(ModifiedDjoserUserSerializer.Meta):
+        fields = ('email', 'id', 'username', 'first_name', 'last_name',)
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+
+class RecipeFragmentSerializer(ReadRecipeSerializer):
+    """
+    Сериализатор общей для всех пользователей части представления рецепта,
+    которая хранится в кеше. Признаки избранного, списка покупок и подписки
+    на автора добавляются при формировании ответа.
+    """
+
+    author = AuthorFragmentSerializer(read_only=True)
+    is_favorited = None
+    is_in_shopping_cart = None
+
+    class Meta(ReadRecipeSerializer.Meta):
+        fields = ('id', 'author', 'tags', 'name', 'text', 'ingredients',
+                  'image', 'cooking_time')
+
+
+class ShortRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор для отображения рецептов.
     Версия с уменьшенным количеством полей.
@@ -237,14 +268,16 @@ class RegistrationSerializer(serializers.ModelSerializer):
         )
 
 
-class FollowUnfollowSerializer(serializers.ModelSerializer):
+class FollowUnfollowSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     """
     Сериализатор подписок.
     """
 
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -254,6 +287,8 @@ class FollowUnfollowSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         follower = self.context.get('request').user
         return (
             follower.is_authenticated
@@ -264,9 +299,12 @@ class FollowUnfollowSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes(self, obj):
-        recipes = Recipe.objects.filter(author=obj)
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = Recipe.objects.filter(author=obj)
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         serializer = ShortRecipeSerializer(recipes, many=True)
         return serializer.data
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
@@ -0,0 +1,85 @@
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api.cache import bump_version
+from api.ingredient_index import ingredient_index
+from api.recipe_index import recipe_index
+from api.search import restore_search_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_recipe_index(sender, instance, **kwargs):
+    recipe_index.update(instance.id, ())
+
+
+@receiver(post_delete, sender=Ingredient)
+def invalidate_recipe_index(sender, **kwargs):
+    """
+    Связь RecipeIngredient.ingredient защищена PROTECT: удалить можно только
+    ингредиент, который не входит ни в один рецепт, и состав рецептов от
+    этого не меняется. Версия индекса рецептов всё равно увеличивается,
+    чтобы индекс во всех процессах оставался верным, если защиту связи
+    заменят каскадным удалением.
+    """
+    bump_version(RecipeIngredient)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_reference_data_version(sender, **kwargs):
+    bump_version(sender)
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields=None,
+                         **kwargs):
+    """
+    Данные автора входят в представление рецепта, поэтому при изменении
+    профиля обновляется метка изменения его рецептов.
+    """
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    Recipe.objects.filter(author=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_related_recipes(sender, instance, created, **kwargs):
+    """
+    Названия тегов и ингредиентов входят в представление рецепта, поэтому
+    при их изменении обновляется метка изменения связанных рецептов.
+    """
+    if created:
+        return
+    lookup = 'tags' if sender is Tag else 'ingredients'
+    Recipe.objects.filter(**{lookup: instance}).update(
+        updated_at=timezone.now()
+    )
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, verbosity=1, **kwargs):
+    """
+    Миграции, пересоздающие таблицу рецептов на SQLite, удаляют триггеры
+    поискового индекса. После миграций отсутствующие триггеры создаются
+    заново, а индекс перестраивается.
+    """
+    if sender.name != 'recipes':
+        return
+    restored = restore_search_index()
+    if restored and verbosity:
+        print(
+            'Восстановлены триггеры поискового индекса: '
+            + ', '.join(restored)
+        )
@@ -0,0 +1,98 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.management.commands.benchmark import IMAGE
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+# Тесты выполняются в одном процессе, поэтому им достаточно кеша в памяти,
+# который очищается перед каждым тестом.
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class APITestBase(TestCase):
+    """
+    Базовый класс тестов API: кеш в памяти, временный MEDIA_ROOT для
+    картинок рецептов и функции создания пользователей и рецептов.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def create_user(self, username):
+        return User.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            password='password',
+            first_name=username.capitalize(),
+            last_name='Тестовый',
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def create_ingredients(self, count):
+        return [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            ) for number in range(count)
+        ]
+
+    def create_tag(self, slug):
+        return Tag.objects.create(
+            name=slug.capitalize(), color=f'#{len(slug):06x}', slug=slug
+        )
+
+    def create_recipe(self, author, ingredients, name='Рецепт'):
+        """
+        Создаёт рецепт без API. ingredients - словарь {ингредиент:
+        количество}.
+        """
+        recipe = Recipe.objects.create(
+            author=author, name=name, text='Описание',
+            image='images/test.png', cooking_time=10,
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=amount)
+            for ingredient, amount in ingredients.items()
+        )
+        return recipe
+
+    def recipe_payload(self, ingredients, tags, name='Рецепт'):
+        return {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients.items()
+            ],
+            'tags': [tag.id for tag in tags],
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': IMAGE,
+        }
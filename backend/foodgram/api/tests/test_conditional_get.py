@@ -0,0 +1,97 @@
+from api.tests.base import APITestBase
+from recipes.models import Ingredient, Tag
+
+
+class ConditionalGetTests(APITestBase):
+    """
+    ETag рецептов и справочников меняется при изменении данных, входящих
+    в ответ, а совпадающий If-None-Match даёт ответ 304.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.user = self.create_user('reader')
+        self.client = self.client_for(self.user)
+        self.ingredient, = self.create_ingredients(1)
+        self.tag = self.create_tag('lunch')
+        self.recipe = self.create_recipe(
+            self.author, {self.ingredient: 10}
+        )
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def assertNotModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_detail(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotModified(self.url, etag)
+
+    def test_detail_after_user_flag_change(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(f'{self.url}favorite/')
+        response = self.assertModified(self.url, etag)
+        self.assertTrue(response.data['is_favorited'])
+
+    def test_detail_is_per_user(self):
+        self.client.post(f'{self.url}favorite/')
+        etag = self.client.get(self.url)['ETag']
+        response = self.client_for(self.author).get(
+            self.url, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['is_favorited'])
+
+    def test_detail_after_ingredient_rename(self):
+        etag = self.client.get(self.url)['ETag']
+        self.ingredient.name = 'Мука'
+        self.ingredient.save()
+        response = self.assertModified(self.url, etag)
+        self.assertEqual(response.data['ingredients'][0]['name'], 'Мука')
+
+    def test_detail_after_author_change(self):
+        etag = self.client.get(self.url)['ETag']
+        self.author.first_name = 'Новое'
+        self.author.save()
+        response = self.assertModified(self.url, etag)
+        self.assertEqual(response.data['author']['first_name'], 'Новое')
+
+    def test_detail_after_update(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client_for(self.author).patch(
+            self.url,
+            self.recipe_payload({self.ingredient: 20}, [self.tag], 'Новый'),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.assertModified(self.url, etag)
+        self.assertEqual(response.data['name'], 'Новый')
+
+    def test_list_after_new_recipe(self):
+        url = '/api/recipes/?limit=2'
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, etag)
+        recipe = self.create_recipe(self.author, {self.ingredient: 5})
+        response = self.assertModified(url, etag)
+        self.assertEqual(response.data['results'][0]['id'], recipe.id)
+
+    def test_reference_data(self):
+        for url, model, instance in (
+            ('/api/tags/', Tag, self.tag),
+            ('/api/ingredients/', Ingredient, self.ingredient),
+        ):
+            with self.subTest(model=model.__name__):
+                etag = self.client.get(url)['ETag']
+                self.assertNotModified(url, etag)
+                instance.name = f'{instance.name} (новое)'
+                instance.save()
+                response = self.assertModified(url, etag)
+                self.assertIn('(новое)', response.content.decode())
@@ -0,0 +1,112 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from api.tests.base import APITestBase
+from recipes.models import Recipe
+from users.models import User
+
+
+class CounterTests(APITestBase):
+    """
+    Счётчики избранного, рецептов и подписчиков изменяются выражениями F()
+    и не затираются полным сохранением объекта.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.user = self.create_user('reader')
+        self.client = self.client_for(self.user)
+        self.ingredient, = self.create_ingredients(1)
+        self.tag = self.create_tag('dinner')
+        self.recipe = self.create_recipe(
+            self.author, {self.ingredient: 100}
+        )
+
+    def favorites_count(self):
+        return Recipe.objects.get(id=self.recipe.id).favorites_count
+
+    def author_counters(self, author=None):
+        return User.objects.values_list(
+            'recipes_count', 'followers_count'
+        ).get(id=(author or self.author).id)
+
+    def test_favorites_count(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.client_for(self.author).post(url)
+        self.assertEqual(self.favorites_count(), 2)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.favorites_count(), 1)
+        self.client.delete(url)
+        self.assertEqual(self.favorites_count(), 1)
+
+    def test_followers_count(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.author_counters(), (0, 1))
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.client.delete(url)
+        self.assertEqual(self.author_counters(), (0, 0))
+
+    def test_recipes_count(self):
+        cook = self.create_user('cook')
+        client = self.client_for(cook)
+        response = client.post(
+            '/api/recipes/',
+            self.recipe_payload({self.ingredient: 50}, [self.tag]),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.author_counters(cook), (1, 0))
+        response = client.delete(f'/api/recipes/{response.data["id"]}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.author_counters(cook), (0, 0))
+
+    def test_full_save_keeps_user_counters(self):
+        stale = User.objects.get(id=self.author.id)
+        User.objects.filter(id=self.author.id).update(
+            recipes_count=3, followers_count=5
+        )
+        stale.first_name = 'Новое имя'
+        stale.set_password('new-password')
+        stale.save()
+        self.assertEqual(self.author_counters(), (3, 5))
+        self.assertEqual(
+            User.objects.get(id=self.author.id).first_name, 'Новое имя'
+        )
+
+    def test_recipe_update_keeps_favorites_count(self):
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        stale = Recipe.objects.get(id=self.recipe.id)
+        self.client_for(self.author).post(
+            f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        stale.name = 'Новое название'
+        stale.save()
+        self.assertEqual(self.favorites_count(), 2)
+        response = self.client_for(self.author).patch(
+            f'/api/recipes/{self.recipe.id}/',
+            self.recipe_payload({self.ingredient: 150}, [self.tag]),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.favorites_count(), 2)
+
+    def test_new_objects_are_saved_with_counters(self):
+        user = User(username='created', email='created@example.com',
+                    recipes_count=2)
+        user.save()
+        self.assertEqual(User.objects.get(id=user.id).recipes_count, 2)
+
+    def test_reconcile_counters(self):
+        Recipe.objects.filter(id=self.recipe.id).update(favorites_count=7)
+        User.objects.filter(id=self.author.id).update(followers_count=4)
+        out = StringIO()
+        call_command('reconcile_counters', '--check', stdout=out)
+        self.assertIn('recipe.favorites_count: расхождений 1', out.getvalue())
+        self.assertEqual(self.favorites_count(), 7)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self.favorites_count(), 0)
+        self.assertEqual(self.author_counters(), (1, 0))
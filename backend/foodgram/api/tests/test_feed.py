@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.db.models import F
+
+from api.feed import add_to_feeds, backfill_feed, prune_feed
+from api.tests.base import APITestBase
+from recipes.models import FeedEntry
+from users.models import Follow, User
+
+
+class FeedTests(APITestBase):
+    """
+    Лента подписок собирается из скопированных рецептов и рецептов
+    авторов с большим числом подписчиков. Фоновые задачи выполняются
+    после фиксации транзакции, поэтому в тестах они вызываются напрямую.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.reader = self.create_user('reader')
+        self.client = self.client_for(self.reader)
+        self.ingredient, = self.create_ingredients(1)
+
+    def follow(self, follower, author):
+        Follow.objects.create(follower=follower, following=author)
+        User.objects.filter(id=author.id).update(
+            followers_count=F('followers_count') + 1
+        )
+        backfill_feed(follower.id, author.id)
+
+    def publish(self, author, name='Рецепт'):
+        recipe = self.create_recipe(author, {self.ingredient: 10}, name)
+        add_to_feeds(recipe.id, author.id)
+        return recipe
+
+    def feed_ids(self, limit=2):
+        ids = []
+        url = f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_fan_out_in_chunks(self):
+        author = self.create_user('author')
+        followers = [self.create_user(f'follower{n}') for n in range(5)]
+        for follower in followers:
+            self.follow(follower, author)
+        with mock.patch('api.feed.FANOUT_CHUNK_SIZE', 2):
+            recipe = self.publish(author)
+        self.assertEqual(
+            set(FeedEntry.objects.filter(recipe=recipe).values_list(
+                'user', flat=True
+            )),
+            {follower.id for follower in followers}
+        )
+
+    def test_backfill_and_prune(self):
+        author = self.create_user('author')
+        old = [self.publish(author, f'Старый {n}') for n in range(3)]
+        self.follow(self.reader, author)
+        self.assertEqual(
+            self.feed_ids(),
+            sorted((recipe.id for recipe in old), reverse=True)
+        )
+        Follow.objects.filter(follower=self.reader).delete()
+        prune_feed(self.reader.id, author.id)
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed_ids(), [])
+
+    def test_entries_of_unfollowed_authors_are_hidden(self):
+        author = self.create_user('author')
+        self.follow(self.reader, author)
+        self.publish(author)
+        Follow.objects.filter(follower=self.reader).delete()
+        self.assertTrue(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed_ids(), [])
+
+    def test_merged_sources(self):
+        regular = self.create_user('regular')
+        popular = self.create_user('popular')
+        stranger = self.create_user('stranger')
+        self.follow(self.reader, regular)
+        with mock.patch('api.feed.FANOUT_FOLLOWERS_LIMIT', 0):
+            self.follow(self.reader, popular)
+            recipes = [
+                self.publish(author, f'Рецепт {number}')
+                for number, author in enumerate(
+                    [regular, popular, stranger, popular, regular] * 2
+                )
+            ]
+            self.assertFalse(FeedEntry.objects.filter(
+                author=popular
+            ).exists())
+            ids = self.feed_ids()
+        self.assertEqual(ids, sorted(
+            (recipe.id for recipe in recipes
+             if recipe.author_id != stranger.id),
+            reverse=True
+        ))
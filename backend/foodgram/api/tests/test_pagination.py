@@ -0,0 +1,118 @@
+from unittest import mock
+
+from api.pagination import EstimatedCountPaginator
+from api.tests.base import APITestBase
+from recipes.models import Recipe
+
+
+class CursorPaginationTests(APITestBase):
+    """
+    Пажинация по ключу должна обходить весь список в порядке страниц без
+    пропусков и повторов.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        ingredient, = self.create_ingredients(1)
+        self.recipes = [
+            self.create_recipe(self.author, {ingredient: 10}, f'Рецепт {n}')
+            for n in range(7)
+        ]
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertNotIn('count', response.data)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_walk(self):
+        ids = self.walk('/api/recipes/?cursor=&limit=2')
+        self.assertEqual(
+            ids, sorted((recipe.id for recipe in self.recipes), reverse=True)
+        )
+
+    def test_walk_with_filter(self):
+        Recipe.objects.filter(
+            id__in=[recipe.id for recipe in self.recipes[1::2]]
+        ).update(author=self.create_user('other'))
+        ids = self.walk(
+            f'/api/recipes/?cursor=&limit=2&author={self.author.id}'
+        )
+        self.assertEqual(
+            ids,
+            sorted((recipe.id for recipe in self.recipes[::2]), reverse=True)
+        )
+
+    def test_previous(self):
+        first = self.client.get('/api/recipes/?cursor=&limit=3')
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual(previous.data['results'], first.data['results'])
+
+    def test_page_after_delete(self):
+        response = self.client.get('/api/recipes/?cursor=&limit=3')
+        last = response.data['results'][-1]['id']
+        Recipe.objects.filter(id=last).delete()
+        ids = self.walk(response.data['next'])
+        self.assertEqual(
+            ids,
+            sorted((recipe.id for recipe in self.recipes if recipe.id < last),
+                   reverse=True)
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_mode(self):
+        response = self.client.get('/api/recipes/?limit=3&page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipes[0].id]
+        )
+
+
+class EstimatedCountPaginatorTests(APITestBase):
+    """
+    Оценка количества из статистики используется только для списков без
+    фильтров по большим таблицам.
+    """
+
+    def setUp(self):
+        super().setUp()
+        author = self.create_user('author')
+        ingredient, = self.create_ingredients(1)
+        for number in range(3):
+            self.create_recipe(author, {ingredient: 10}, f'Рецепт {number}')
+
+    def count(self, queryset, estimate):
+        paginator = EstimatedCountPaginator(queryset.order_by('-id'), 2)
+        with mock.patch.object(
+            EstimatedCountPaginator, 'estimate_count', return_value=estimate
+        ):
+            return paginator.count
+
+    def test_large_table_uses_estimate(self):
+        threshold = EstimatedCountPaginator.estimate_threshold
+        self.assertEqual(
+            self.count(Recipe.objects.all(), threshold), threshold
+        )
+
+    def test_small_table_is_counted(self):
+        self.assertEqual(self.count(Recipe.objects.all(), 2), 3)
+
+    def test_other_database_is_counted(self):
+        self.assertEqual(self.count(Recipe.objects.all(), None), 3)
+
+    def test_filtered_list_is_counted(self):
+        threshold = EstimatedCountPaginator.estimate_threshold
+        self.assertEqual(
+            self.count(Recipe.objects.filter(name='Рецепт 1'), threshold), 1
+        )
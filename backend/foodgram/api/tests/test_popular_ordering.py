@@ -0,0 +1,78 @@
+from base64 import b64encode
+
+from api.tests.base import APITestBase
+from recipes.models import Recipe, RecipePopularity
+
+SCORES = (2.0, None, 5.0, 2.0, None, 1.0, None, 2.0, None)
+
+
+class PopularOrderingTests(APITestBase):
+    """
+    Сортировка по популярности: по убыванию оценки, рецепты без оценки в
+    конце, при равных оценках по убыванию id. Пажинация по ключу должна
+    давать тот же порядок, что и постраничная.
+    """
+
+    def setUp(self):
+        super().setUp()
+        author = self.create_user('author')
+        ingredient, = self.create_ingredients(1)
+        self.scores = {}
+        for number, score in enumerate(SCORES):
+            recipe = self.create_recipe(
+                author, {ingredient: 10}, f'Рецепт {number}'
+            )
+            self.scores[recipe.id] = score
+            if score is not None:
+                RecipePopularity.objects.create(recipe=recipe, score=score)
+        self.expected = sorted(
+            self.scores,
+            key=lambda pk: (self.scores[pk] is None,
+                            -(self.scores[pk] or 0), -pk)
+        )
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertIsNone(response.data['previous'])
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_page_mode(self):
+        response = self.client.get(
+            f'/api/recipes/?ordering=popular&limit={len(SCORES)}'
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            self.expected
+        )
+
+    def test_cursor_walk(self):
+        for limit in range(1, len(SCORES) + 1):
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    self.walk(
+                        f'/api/recipes/?ordering=popular&cursor=&limit={limit}'
+                    ),
+                    self.expected
+                )
+
+    def test_cursor_after_delete(self):
+        response = self.client.get(
+            '/api/recipes/?ordering=popular&cursor=&limit=3'
+        )
+        Recipe.objects.filter(
+            id=response.data['results'][-1]['id']
+        ).delete()
+        ids = self.walk(response.data['next'])
+        self.assertEqual(ids, self.expected[3:])
+
+    def test_invalid_position(self):
+        cursor = b64encode(b'p=abc:1').decode()
+        response = self.client.get(
+            f'/api/recipes/?ordering=popular&cursor={cursor}'
+        )
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,142 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError
+
+from api.tests.base import APITestBase
+from recipes.management.commands.rebuild_shopping_lists import (
+    aggregate_totals,
+)
+from recipes.models import ShoppingList, ShoppingListIngredient
+
+
+class ShoppingListTotalsTests(APITestBase):
+    """
+    Суммы ингредиентов в таблице ShoppingListIngredient должны совпадать с
+    суммами, вычисленными по рецептам в списках покупок.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.user = self.create_user('buyer')
+        self.client = self.client_for(self.user)
+        self.flour, self.sugar, self.salt = self.create_ingredients(3)
+        self.tag = self.create_tag('breakfast')
+        self.pancakes = self.create_recipe(
+            self.author, {self.flour: 200, self.sugar: 30}, 'Блины'
+        )
+        self.bread = self.create_recipe(
+            self.author, {self.flour: 500, self.salt: 10}, 'Хлеб'
+        )
+
+    def stored_totals(self):
+        return {
+            (user, ingredient): (amount, recipes_count)
+            for user, ingredient, amount, recipes_count
+            in ShoppingListIngredient.objects.values_list(
+                'user', 'ingredient', 'amount', 'recipes_count'
+            )
+        }
+
+    def assertTotals(self, expected):
+        stored = self.stored_totals()
+        self.assertEqual(stored, aggregate_totals())
+        self.assertEqual(stored, {
+            (self.user.id, ingredient.id): totals
+            for ingredient, totals in expected.items()
+        })
+
+    def add(self, recipe):
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+
+    def remove(self, recipe):
+        response = self.client.delete(
+            f'/api/recipes/{recipe.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+
+    def test_add_and_remove(self):
+        self.add(self.pancakes)
+        self.assertTotals({self.flour: (200, 1), self.sugar: (30, 1)})
+        self.add(self.bread)
+        self.assertTotals({
+            self.flour: (700, 2), self.sugar: (30, 1), self.salt: (10, 1),
+        })
+        self.remove(self.pancakes)
+        self.assertTotals({self.flour: (500, 1), self.salt: (10, 1)})
+        self.remove(self.bread)
+        self.assertTotals({})
+
+    def test_repeated_add_does_not_change_totals(self):
+        self.add(self.pancakes)
+        with self.assertRaises(IntegrityError):
+            self.client.post(
+                f'/api/recipes/{self.pancakes.id}/shopping_cart/'
+            )
+        self.assertTotals({self.flour: (200, 1), self.sugar: (30, 1)})
+
+    def test_recipe_update(self):
+        self.add(self.pancakes)
+        self.add(self.bread)
+        author_client = self.client_for(self.author)
+        response = author_client.patch(
+            f'/api/recipes/{self.pancakes.id}/',
+            self.recipe_payload(
+                {self.flour: 250, self.salt: 5}, [self.tag], 'Блины'
+            ),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotals({self.flour: (750, 2), self.salt: (15, 2)})
+
+    def test_recipe_delete(self):
+        self.add(self.pancakes)
+        self.add(self.bread)
+        response = self.client_for(self.author).delete(
+            f'/api/recipes/{self.bread.id}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ShoppingList.objects.filter(
+            recipe_id=self.bread.id
+        ).exists())
+        self.assertTotals({self.flour: (200, 1), self.sugar: (30, 1)})
+
+    def test_other_users_are_not_affected(self):
+        other = self.create_user('other')
+        self.client_for(other).post(
+            f'/api/recipes/{self.bread.id}/shopping_cart/'
+        )
+        self.add(self.pancakes)
+        self.remove(self.pancakes)
+        self.assertEqual(self.stored_totals(), aggregate_totals())
+        self.assertEqual(
+            set(ShoppingListIngredient.objects.values_list(
+                'user', flat=True
+            )),
+            {other.id},
+        )
+
+    def test_download(self):
+        self.add(self.pancakes)
+        self.add(self.bread)
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=json'
+        )
+        self.assertEqual(response.status_code, 200)
+        content = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(content, [
+            {'name': 'Ингредиент 0', 'amount': 700, 'measurement_unit': 'г'},
+            {'name': 'Ингредиент 1', 'amount': 30, 'measurement_unit': 'г'},
+            {'name': 'Ингредиент 2', 'amount': 10, 'measurement_unit': 'г'},
+        ])
+
+    def test_rebuild_fixes_drift(self):
+        self.add(self.pancakes)
+        ShoppingListIngredient.objects.filter(
+            ingredient=self.flour
+        ).update(amount=1)
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertTotals({self.flour: (200, 1), self.sugar: (30, 1)})
@@ -0,0 +1,66 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Замеры одного запроса: количество и время SQL запросов, время
+    сериализации и отрисовки ответа. Повторяющиеся SQL запросы
+    подсчитываются отдельно для поиска N+1.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = Counter()
+        self.depth = Counter()
+        self.queries = Counter()
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.queries.items() if count > 1}
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - started
+            self.queries[sql] += 1
+
+
+@contextmanager
+def measure(name):
+    """
+    Добавляет время выполнения блока к замеру name текущего запроса.
+    Вложенные блоки с тем же именем не учитываются повторно. Если замеры
+    выключены, блок выполняется без накладных расходов на время.
+    """
+    timings = current_timings.get()
+    if timings is None or timings.depth[name]:
+        yield
+        return
+    timings.depth[name] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.durations[name] += time.perf_counter() - started
+        timings.depth[name] -= 1
+
+
+class TimedSerializerMixin:
+    """
+    Миксин сериализатора, учитывающий время to_representation в замере
+    serialize текущего запроса.
+    """
+
+    def to_representation(self, instance):
+        with measure('serialize'):
+            return super().to_representation(instance)
@@ -2,7 +2,8 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from api.views import (
-    FollowUnfollowViewSet, IngredientViewSet, RecipeViewSet, TagViewSet,
+    FollowUnfollowViewSet, IngredientViewSet, MetricsView, RecipeViewSet,
+    TagViewSet,
 )
 
 
@@ -13,6 +14,7 @@ router_v1.register('recipes', RecipeViewSet)
 router_v1.register('users', FollowUnfollowViewSet, basename='subscription')
 
 urlpatterns = [
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('', include(router_v1.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
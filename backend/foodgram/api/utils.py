@@ -1,9 +1,66 @@
+import csv
+import json
+
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Case, Exists, F, IntegerField, OuterRef, Prefetch, Value,
+    When, Window,
+)
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
 import api.serializers as serializers
-from recipes.models import Recipe, RecipeIngredient, RecipeTag
+from api.recipe_index import recipe_index
+from recipes.models import (
+    Favorite, Recipe, RecipeIngredient, RecipeTag, ShoppingList,
+    ShoppingListIngredient,
+)
+from users.models import Follow
+
+SHOPPING_CART_FIELDS = ('name', 'amount', 'measurement_unit')
+
+
+def get_recipe_read_queryset():
+    """
+    Функция возвращающая queryset рецептов для чтения: автор подтягивается
+    JOIN-ом, теги и ингредиенты одним запросом на страницу.
+    """
+    return Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'recipeingredient_set',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ),
+    )
+
+
+def annotate_recipe_flags(queryset, user):
+    """
+    Функция добавляющая к queryset рецептов признаки избранного, списка
+    покупок и подписки на автора для пользователя. Признаки вычисляются
+    подзапросами Exists, для анонимного пользователя они ложны.
+    """
+    if user.is_anonymous:
+        false = Value(False, output_field=BooleanField())
+        return queryset.annotate(
+            is_favorited=false,
+            is_in_shopping_cart=false,
+            author_is_subscribed=false,
+        )
+    return queryset.annotate(
+        is_favorited=Exists(Favorite.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )),
+        is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )),
+        author_is_subscribed=Exists(Follow.objects.filter(
+            follower=user, following=OuterRef('author')
+        )),
+    )
 
 
 def add_ingredients_and_tags(recipe, ingredients, tags):
@@ -19,6 +76,11 @@ def add_ingredients_and_tags(recipe, ingredients, tags):
         ) for data in ingredients
     ]
     RecipeIngredient.objects.bulk_create(recipeingredients)
+    recipe_index.update(
+        recipe.id,
+        [recipeingredient.ingredient_id for recipeingredient in
+         recipeingredients]
+    )
     tag_list = [
         RecipeTag(
             tag=tag,
@@ -28,6 +90,80 @@ def add_ingredients_and_tags(recipe, ingredients, tags):
     RecipeTag.objects.bulk_create(tag_list)
 
 
+def update_ingredients_and_tags(recipe, ingredients, tags):
+    """
+    Функция обновляющая ингредиенты и теги рецепта по разнице между
+    сохранёнными и переданными значениями: создаются только новые связи,
+    количество обновляется только у изменившихся ингредиентов, удаляются
+    только убранные связи. Если ingredients или tags равны None, они не
+    изменяются. Возвращает изменения для сумм в списках покупок.
+    """
+    changes = {}
+    if ingredients is not None:
+        existing = {
+            recipeingredient.ingredient_id: recipeingredient
+            for recipeingredient in RecipeIngredient.objects.filter(
+                recipe=recipe
+            )
+        }
+        old_amounts = {
+            ingredient: recipeingredient.amount
+            for ingredient, recipeingredient in existing.items()
+        }
+        new_amounts = {
+            data['ingredient'].id: data['amount'] for data in ingredients
+        }
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient__in=removed
+            ).delete()
+        changed = []
+        for ingredient, amount in new_amounts.items():
+            if ingredient in existing and old_amounts[ingredient] != amount:
+                existing[ingredient].amount = amount
+                changed.append(existing[ingredient])
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        added = [
+            RecipeIngredient(
+                recipe=recipe,
+                amount=data['amount'],
+                ingredient=data['ingredient']
+            ) for data in ingredients if data['ingredient'].id not in existing
+        ]
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+        if removed or added:
+            recipe_index.update(recipe.id, new_amounts)
+        changes = get_ingredients_diff_changes(old_amounts, new_amounts)
+    if tags is not None:
+        update_tags(recipe, tags)
+    return changes
+
+
+def update_tags(recipe, tags):
+    """
+    Функция обновляющая теги рецепта по разнице между сохранёнными и
+    переданными тегами.
+    """
+    old_tags = set(
+        RecipeTag.objects.filter(
+            recipe=recipe
+        ).values_list('tag', flat=True)
+    )
+    new_tags = {tag.id for tag in tags}
+    if old_tags - new_tags:
+        RecipeTag.objects.filter(
+            recipe=recipe, tag__in=old_tags - new_tags
+        ).delete()
+    if new_tags - old_tags:
+        RecipeTag.objects.bulk_create(
+            RecipeTag(tag_id=tag, recipe=recipe)
+            for tag in new_tags - old_tags
+        )
+
+
 def add_or_remove_from_list(list_model, request, pk):
     """
     Функция добавляющая или удаляющая связь рецепта с пользователем
@@ -36,10 +172,236 @@ def add_or_remove_from_list(list_model, request, pk):
     user = request.user
     recipe = get_object_or_404(Recipe, id=pk)
     if request.method == 'POST':
-        list_model.objects.create(user=user, recipe=recipe)
+        with transaction.atomic():
+            list_model.objects.create(user=user, recipe=recipe)
+            if list_model is ShoppingList:
+                update_shopping_list_totals(
+                    [user.id], get_recipe_ingredients_changes(recipe, 1)
+                )
+            if list_model is Favorite:
+                Recipe.objects.filter(id=recipe.id).update(
+                    favorites_count=F('favorites_count') + 1
+                )
         serializer = serializers.ShortRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     if request.method == 'DELETE':
-        list_model.objects.filter(user=user, recipe=recipe).delete()
+        with transaction.atomic():
+            deleted, _ = list_model.objects.filter(
+                user=user, recipe=recipe
+            ).delete()
+            if deleted and list_model is ShoppingList:
+                update_shopping_list_totals(
+                    [user.id], get_recipe_ingredients_changes(recipe, -1)
+                )
+            if deleted and list_model is Favorite:
+                Recipe.objects.filter(id=recipe.id).update(
+                    favorites_count=F('favorites_count') - 1
+                )
         return Response(status=status.HTTP_204_NO_CONTENT)
     return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+def get_recipes_limit(request):
+    """
+    Функция возвращающая значение параметра recipes_limit из запроса
+    или None, если параметр не задан или некорректен.
+    """
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    if recipes_limit < 0:
+        return None
+    return recipes_limit
+
+
+def get_max_missing(request):
+    """
+    Функция возвращающая значение параметра max_missing из запроса
+    или None, если параметр не задан или некорректен.
+    """
+    try:
+        max_missing = int(request.query_params['max_missing'])
+    except (KeyError, ValueError):
+        return None
+    if max_missing < 0:
+        return None
+    return max_missing
+
+
+def get_ingredient_ids(request):
+    """
+    Функция возвращающая множество id ингредиентов из параметра ingredients
+    запроса. Параметр передаётся несколько раз или через запятую.
+    """
+    values = [
+        value.strip()
+        for param in request.query_params.getlist('ingredients')
+        for value in param.split(',') if value.strip()
+    ]
+    try:
+        return {int(value) for value in values}
+    except ValueError:
+        raise ValidationError(
+            {'ingredients': 'Ожидается список id ингредиентов.'}
+        )
+
+
+def attach_limited_recipes(authors, recipes_limit=None):
+    """
+    Функция подгружающая рецепты для страницы авторов одним запросом.
+    Рецепты нумеруются оконной функцией внутри каждого автора, из базы
+    выбираются только первые recipes_limit рецептов каждого автора.
+    Результат сохраняется в атрибут limited_recipes каждого автора.
+    """
+    authors = list(authors)
+    recipes = {author.id: [] for author in authors}
+    if not authors:
+        return authors
+    ranked = Recipe.objects.filter(
+        author__in=recipes.keys()
+    ).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author')],
+            order_by=F('id').desc(),
+        )
+    ).values('id', 'name', 'image', 'cooking_time', 'author_id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    query = f'SELECT * FROM ({sql}) ranked'
+    if recipes_limit is not None:
+        query += ' WHERE ranked.row_number <= %s'
+        params = (*params, recipes_limit)
+    query += ' ORDER BY ranked.author_id, ranked.row_number'
+    for recipe in Recipe.objects.raw(query, params):
+        recipes[recipe.author_id].append(recipe)
+    for author in authors:
+        author.limited_recipes = recipes[author.id]
+    return authors
+
+
+def get_recipe_ingredients_changes(recipe, sign):
+    """
+    Функция возвращающая изменения сумм в списке покупок при добавлении
+    (sign=1) или удалении (sign=-1) рецепта из списка покупок.
+    """
+    return {
+        ingredient: (sign * amount, sign)
+        for ingredient, amount in RecipeIngredient.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient', 'amount')
+    }
+
+
+def get_ingredients_diff_changes(old_amounts, new_amounts):
+    """
+    Функция возвращающая изменения сумм в списке покупок при изменении
+    ингредиентов рецепта. Принимает словари {id ингредиента: количество}
+    до и после изменения.
+    """
+    changes = {}
+    for ingredient in old_amounts.keys() | new_amounts.keys():
+        amount = new_amounts.get(ingredient, 0) - old_amounts.get(
+            ingredient, 0
+        )
+        recipes_count = (
+            (ingredient in new_amounts) - (ingredient in old_amounts)
+        )
+        if amount or recipes_count:
+            changes[ingredient] = (amount, recipes_count)
+    return changes
+
+
+def change_case(changes, position):
+    """
+    Функция строящая выражение CASE с изменением значения для каждого
+    ингредиента из changes.
+    """
+    return Case(
+        *[
+            When(ingredient_id=ingredient, then=Value(change[position]))
+            for ingredient, change in changes.items()
+        ],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def update_shopping_list_totals(users, changes):
+    """
+    Функция применяющая изменения к суммам ингредиентов в списках покупок
+    пользователей. changes - словарь {id ингредиента: (изменение количества,
+    изменение числа рецептов)}. Все изменения применяются одним запросом
+    UPDATE с выражениями CASE по ингредиентам.
+    """
+    if not changes:
+        return
+    ShoppingListIngredient.objects.bulk_create(
+        [
+            ShoppingListIngredient(user_id=user, ingredient_id=ingredient)
+            for user in users
+            for ingredient, (_, recipes_count) in changes.items()
+            if recipes_count > 0
+        ],
+        ignore_conflicts=True
+    )
+    totals = ShoppingListIngredient.objects.filter(
+        user__in=users, ingredient__in=changes.keys()
+    )
+    totals.update(
+        amount=F('amount') + change_case(changes, 0),
+        recipes_count=F('recipes_count') + change_case(changes, 1),
+    )
+    if any(recipes_count < 0 for _, recipes_count in changes.values()):
+        totals.filter(recipes_count__lte=0).delete()
+
+
+def get_shopping_cart(user):
+    """
+    Функция возвращающая суммарное количество каждого ингредиента из
+    рецептов в списке покупок пользователя. Суммы хранятся в таблице
+    ShoppingListIngredient и читаются по индексу пользователя.
+    """
+    return ShoppingListIngredient.objects.filter(
+        user=user
+    ).values_list(
+        'ingredient__name', 'amount', 'ingredient__measurement_unit'
+    ).order_by('ingredient__name')
+
+
+class Echo:
+    """
+    Псевдо-буфер для csv.writer, возвращающий записанную строку.
+    """
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_txt(lines):
+    for name, amount, measurement_unit in lines:
+        yield f'{name}, {amount} {measurement_unit}\n'
+
+
+def shopping_cart_csv(lines):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOPPING_CART_FIELDS)
+    for line in lines:
+        yield writer.writerow(line)
+
+
+def shopping_cart_json(lines):
+    separator = '['
+    for line in lines:
+        yield separator + json.dumps(
+            dict(zip(SHOPPING_CART_FIELDS, line)), ensure_ascii=False
+        )
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_CART_WRITERS = {
+    'txt': shopping_cart_txt,
+    'csv': shopping_cart_csv,
+    'json': shopping_cart_json,
+}
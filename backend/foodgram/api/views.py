@@ -1,25 +1,46 @@
 
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import BooleanField, Exists, F, OuterRef, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from api.filters import IngredientFilter, ResipeFilter
-from api.permissions import IsAuthor, ReadOnly
+from api.cache import VersionedCacheMixin, make_etag, not_modified
+from api.feed import (
+    add_to_feeds, backfill_feed, get_feed_sources, prune_feed,
+    run_in_background,
+)
+from api.filters import (
+    IngredientFilter, RecipeOrderingFilter, ResipeFilter,
+)
+from api.fragments import render_recipes
+from api.ingredient_index import ingredient_index
+from api.pagination import DefaultLimitPagePagination, MergedCursorPagination
+from api.metrics import store
+from api.permissions import IsAuthor, IsStaffOrInternal, ReadOnly
+from api.recipe_index import recipe_index
+from api.renderers import CSVRenderer, PlainTextRenderer
 from api.serializers import (
     FollowUnfollowSerializer, IngredientSerializer, ReadRecipeSerializer,
     TagSerializer, WriteRecipeSerializer,
 )
-from api.utils import add_or_remove_from_list
+from api.utils import (
+    SHOPPING_CART_WRITERS, add_or_remove_from_list, annotate_recipe_flags,
+    attach_limited_recipes, get_ingredient_ids, get_max_missing,
+    get_recipe_ingredients_changes, get_recipe_read_queryset,
+    get_recipes_limit, get_shopping_cart, update_shopping_list_totals,
+)
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingList, Tag
 from users.models import Follow, User
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для ингредиентов.
     """
@@ -30,8 +51,18 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск по названию обслуживается индексом в памяти процесса без
+        обращения к базе данных.
+        """
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для тегов.
     """
@@ -48,16 +79,122 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthor | ReadOnly]
-    filter_backends = (DjangoFilterBackend, )
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = ResipeFilter
 
+    def get_queryset(self):
+        """
+        Для чтения рецептов автор подтягивается JOIN-ом, теги и ингредиенты
+        одним запросом на страницу, а признаки избранного, списка покупок и
+        подписки на автора вычисляются подзапросами Exists. Количество
+        запросов не зависит от размера страницы.
+        """
+        if self.request.method not in permissions.SAFE_METHODS:
+            return Recipe.objects.all()
+        return annotate_recipe_flags(
+            self.get_fragment_queryset(), self.request.user
+        )
+
+    def get_fragment_queryset(self):
+        return get_recipe_read_queryset()
+
+    def get_stamps(self, queryset):
+        """
+        Метки версий рецептов вместе с признаками, зависящими от
+        пользователя. Из них строится ETag без запуска сериализаторов.
+        Оценка популярности нужна пажинации по ключу при сортировке по
+        популярности.
+        """
+        fields = [
+            'id', 'updated_at', 'is_favorited', 'is_in_shopping_cart',
+            'author_is_subscribed'
+        ]
+        if 'popularity_score' in queryset.query.annotations:
+            fields.append('popularity_score')
+        return queryset.prefetch_related(None).values(*fields)
+
+    def list(self, request, *args, **kwargs):
+        stamps = self.get_stamps(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(stamps)
+        if page is None:
+            etag = make_etag(request.accepted_media_type, list(stamps))
+        else:
+            etag = make_etag(
+                request.accepted_media_type,
+                list(page),
+                self.get_paginated_response([]).data,
+            )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        data = render_recipes(
+            list(stamps) if page is None else page,
+            self.get_fragment_queryset(),
+            self.get_serializer_context()
+        )
+        if page is None:
+            response = Response(data)
+        else:
+            response = self.get_paginated_response(data)
+        response['ETag'] = etag
+        return response
+
+    def get_lookup_pk(self):
+        """
+        Id рецепта из адреса. Для нечислового id возвращается 404, как у
+        get_object_or_404 из DRF, а не ошибка при построении запроса.
+        """
+        try:
+            return int(self.kwargs[self.lookup_field])
+        except (TypeError, ValueError):
+            raise Http404
+
+    def retrieve(self, request, *args, **kwargs):
+        stamp = self.get_stamps(self.get_queryset()).filter(
+            pk=self.get_lookup_pk()
+        ).first()
+        if stamp is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = make_etag(request.accepted_media_type, stamp)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        data = render_recipes(
+            [stamp],
+            self.get_fragment_queryset(),
+            self.get_serializer_context()
+        )
+        if not data:
+            raise Http404
+        response = Response(data[0])
+        response['ETag'] = etag
+        return response
+
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PATCH']:
             return WriteRecipeSerializer
         return ReadRecipeSerializer
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            recipe = serializer.save(author=self.request.user)
+            User.objects.filter(id=self.request.user.id).update(
+                recipes_count=F('recipes_count') + 1
+            )
+            run_in_background(add_to_feeds, recipe.id, recipe.author_id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            update_shopping_list_totals(
+                list(ShoppingList.objects.filter(
+                    recipe=instance
+                ).values_list('user', flat=True)),
+                get_recipe_ingredients_changes(instance, -1)
+            )
+            User.objects.filter(id=instance.author_id).update(
+                recipes_count=F('recipes_count') - 1
+            )
+            instance.delete()
 
     """
     Эндпойнт для работы с избранным.
@@ -84,34 +221,106 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return add_or_remove_from_list(ShoppingList, request, pk)
 
     """
-    Эндпойнт для скачивания списка покупок.
+    Эндпойнт для скачивания списка покупок в формате txt, csv или json,
+    формат выбирается параметром format. Файл отдаётся потоком.
     """
     @action(
         detail=False,
         url_path='download_shopping_cart',
-        permission_classes=[IsAuthor, ]
+        permission_classes=[IsAuthor, ],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer],
     )
     def download_shopping_cart(self, request):
-        list = ShoppingList.objects.filter(
-            user=request.user
-        ).values(
-            'recipe__ingredients__name',
-            'recipe__ingredients__measurement_unit'
-        ).annotate(
-            total_amount=Sum('recipe__recipeingredient__amount')
+        renderer = request.accepted_renderer
+        lines = get_shopping_cart(request.user).iterator()
+        response = StreamingHttpResponse(
+            SHOPPING_CART_WRITERS[renderer.format](lines),
+            content_type=f'{renderer.media_type}; charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            f'attachment;filename=shopping_list.{renderer.format}'
         )
-        data = []
-        for line in list:
-            name = line['recipe__ingredients__name']
-            amount = line['total_amount']
-            measurement_unit = line['recipe__ingredients__measurement_unit']
-            data.append(f'{name}, {amount} {measurement_unit}')
-        response_context = '\n'.join(data)
-        response = HttpResponse(response_context, content_type='text/plain')
-        response['Content-Disposition'] = ('attachment;'
-                                           'filename=shopping_list.txt')
         return response
 
+    """
+    Эндпойнт для ленты новых рецептов авторов, на которых подписан
+    пользователь.
+    """
+    @action(
+        detail=False,
+        url_path='feed',
+        permission_classes=[permissions.IsAuthenticated, ],
+    )
+    def feed(self, request):
+        paginator = MergedCursorPagination()
+        ids = paginator.paginate_sources(
+            get_feed_sources(request.user), request
+        )
+        stamps = self.get_stamps(self.get_queryset().filter(pk__in=ids))
+        return paginator.get_paginated_response(render_recipes(
+            list(stamps),
+            self.get_fragment_queryset(),
+            self.get_serializer_context()
+        ))
+
+    """
+    Эндпойнт для получения похожих рецептов, рассчитанных командой
+    build_similar_recipes.
+    """
+    @action(
+        detail=True,
+        url_path='similar',
+    )
+    def similar(self, request, pk):
+        pk = self.get_lookup_pk()
+        stamps = list(self.get_stamps(
+            self.get_queryset().filter(similar_to__recipe=pk).order_by(
+                'similar_to__position'
+            )
+        ))
+        if not stamps:
+            get_object_or_404(Recipe, pk=pk)
+        return Response(render_recipes(
+            stamps,
+            self.get_fragment_queryset(),
+            self.get_serializer_context()
+        ))
+
+    """
+    Эндпойнт для подбора рецептов по имеющимся ингредиентам.
+    """
+    @action(
+        detail=False,
+        url_path='can_cook',
+    )
+    def can_cook(self, request):
+        results = recipe_index.search(
+            get_ingredient_ids(request), get_max_missing(request)
+        )
+        page = self.paginate_queryset(results)
+        rows = results if page is None else page
+        stamps = {
+            stamp['id']: stamp for stamp in self.get_stamps(
+                self.get_queryset().filter(
+                    pk__in=[recipe for recipe, _ in rows]
+                )
+            )
+        }
+        rows = [(recipe, missing) for recipe, missing in rows
+                if recipe in stamps]
+        recipes = render_recipes(
+            [stamps[recipe] for recipe, _ in rows],
+            self.get_fragment_queryset(),
+            self.get_serializer_context()
+        )
+        data = [
+            dict(recipe, missing_ingredients=missing)
+            for recipe, (_, missing) in zip(recipes, rows)
+        ]
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
 
 class FollowUnfollowViewSet(UserViewSet):
     """
@@ -122,6 +331,29 @@ class FollowUnfollowViewSet(UserViewSet):
     serializer_class = FollowUnfollowSerializer
     permission_classes = [permissions.IsAuthenticated, ]
 
+    def get_queryset(self):
+        """
+        Признак подписки на пользователей вычисляется подзапросом Exists,
+        а не отдельным запросом для каждого пользователя.
+        """
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        return queryset.annotate(is_subscribed=Exists(Follow.objects.filter(
+            follower=self.request.user, following=OuterRef('pk')
+        )))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        users = attach_limited_recipes(
+            queryset if page is None else page, get_recipes_limit(request)
+        )
+        serializer = self.get_serializer(users, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
     """
     Эндпойнт для добавления и удаления подписок.
     """
@@ -135,13 +367,26 @@ class FollowUnfollowViewSet(UserViewSet):
         user = request.user
         following = get_object_or_404(User, id=id)
         if request.method == 'POST':
-            Follow.objects.create(follower=user, following=following)
+            with transaction.atomic():
+                Follow.objects.create(follower=user, following=following)
+                User.objects.filter(id=following.id).update(
+                    followers_count=F('followers_count') + 1
+                )
+                run_in_background(backfill_feed, user.id, following.id)
             serializer = FollowUnfollowSerializer(
                 following, context={'request': request}
             )
             return Response(serializer.data, status=status.HTTP_200_OK)
         if request.method == 'DELETE':
-            Follow.objects.filter(follower=user, following=following).delete()
+            with transaction.atomic():
+                deleted, _ = Follow.objects.filter(
+                    follower=user, following=following
+                ).delete()
+                if deleted:
+                    User.objects.filter(id=following.id).update(
+                        followers_count=F('followers_count') - 1
+                    )
+                    run_in_background(prune_feed, user.id, following.id)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
@@ -152,11 +397,33 @@ class FollowUnfollowViewSet(UserViewSet):
         detail=False,
         url_path='subscriptions',
         permission_classes=[IsAuthor, ],
+        pagination_class=DefaultLimitPagePagination,
     )
     def subscriptions_endpoint(self, request):
-        subscriptions = User.objects.filter(following__follower=request.user)
-        queryset = self.paginate_queryset(subscriptions)
+        subscriptions = User.objects.filter(
+            following__follower=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        )
+        queryset = attach_limited_recipes(
+            self.paginate_queryset(subscriptions),
+            get_recipes_limit(request)
+        )
         serializer = FollowUnfollowSerializer(
             queryset, many=True, context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
+
+
+class MetricsView(APIView):
+    """
+    Эндпойнт метрик в формате Prometheus, собранных со всех процессов.
+    """
+
+    permission_classes = [IsStaffOrInternal, ]
+    renderer_classes = [PlainTextRenderer, ]
+
+    def get(self, request):
+        if store is None:
+            raise Http404
+        return Response(store.collect())
@@ -27,6 +27,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -36,6 +38,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+SERVER_TIMING = os.getenv('SERVER_TIMING', '') == 'True'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '').split()
+TRUSTED_PROXIES = os.getenv('TRUSTED_PROXIES', '').split()
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -75,6 +83,16 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', '/var/tmp/foodgram_cache'),
+    }
+}
+
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
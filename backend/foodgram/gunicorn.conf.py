@@ -0,0 +1,41 @@
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+bind = '0:8000'
+
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+
+
+def on_starting(server):
+    """
+    Запускает системные проверки Django, чтобы gunicorn не стартовал с
+    неверной настройкой (например, с кешем в памяти процесса), и переносит
+    в общий файл метрики воркеров предыдущего запуска, которые не успели
+    перенестись при его остановке.
+    """
+    import django
+    from django.core.management import call_command
+    django.setup()
+    call_command('check')
+    if METRICS_DIR:
+        from api.metrics import merge_process
+        merge_process(METRICS_DIR)
+
+
+def worker_exit(server, worker):
+    """
+    Записывает метрики воркера, накопленные с последнего сброса.
+    """
+    from api.metrics import store
+    if store is not None:
+        store.flush()
+
+
+def child_exit(server, worker):
+    """
+    Переносит метрики завершившегося воркера в общий файл.
+    """
+    if METRICS_DIR:
+        from api.metrics import merge_process
+        merge_process(METRICS_DIR, worker.pid)
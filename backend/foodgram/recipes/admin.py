@@ -11,7 +11,7 @@ class RecipeAdmin(ModelAdmin):
     list_filter = ('name', 'author', 'tags')
 
     def in_favorite(self, obj):
-        return models.Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
 
 site.register(models.Tag)
@@ -21,3 +21,4 @@ site.register(models.ShoppingList)
 site.register(models.Ingredient)
 site.register(models.Favorite)
 site.register(models.RecipeTag)
+site.register(models.ShoppingListIngredient)
@@ -0,0 +1,250 @@
+import json
+import math
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, ShoppingList, Tag
+from users.models import Follow, User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+
+
+def percentile(values, share):
+    """
+    Перцентиль по методу ближайшего ранга для отсортированного списка.
+    """
+    if not values:
+        return None
+    rank = max(1, math.ceil(share / 100 * len(values)))
+    return values[rank - 1]
+
+
+class Scenarios:
+    """
+    Сценарии нагрузки. Каждый сценарий возвращает метод, адрес и тело
+    запроса, данные для запросов выбираются из базы случайно.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.recipes = list(Recipe.objects.values_list('id', flat=True))
+        self.tags = list(Tag.objects.values_list('slug', flat=True))
+        self.ingredients = list(
+            Ingredient.objects.values_list('id', 'name')[:500]
+        )
+        self.readers = list(
+            Follow.objects.values_list('follower', flat=True).distinct()[:50]
+        )
+        self.buyers = list(
+            ShoppingList.objects.values_list('user', flat=True).distinct()[:50]
+        )
+        if not self.recipes or not self.ingredients or not self.tags:
+            raise CommandError(
+                'Нет данных для тестирования, запустите команду seed_data'
+            )
+        self.own_recipes = {}
+
+    def recipe_list(self, user):
+        page = self.rng.randint(1, 20)
+        return 'get', f'/api/recipes/?page={page}&limit=6', None
+
+    def recipe_list_filtered(self, user):
+        tags = '&'.join(
+            f'tags={tag}' for tag in self.rng.sample(
+                self.tags, min(2, len(self.tags))
+            )
+        )
+        return 'get', f'/api/recipes/?{tags}&is_favorited=1&limit=6', None
+
+    def recipe_search(self, user):
+        words = Recipe.objects.filter(
+            pk=self.rng.choice(self.recipes)
+        ).values_list('name', flat=True).first().split()
+        return 'get', f'/api/recipes/?search={words[0]}&limit=6', None
+
+    def recipe_detail(self, user):
+        return 'get', f'/api/recipes/{self.rng.choice(self.recipes)}/', None
+
+    def ingredient_autocomplete(self, user):
+        _, name = self.rng.choice(self.ingredients)
+        return 'get', f'/api/ingredients/?name={name[:2]}', None
+
+    def subscriptions(self, user):
+        return (
+            'get', '/api/users/subscriptions/?page=1&limit=6&recipes_limit=3',
+            None
+        )
+
+    def download_shopping_cart(self, user):
+        return 'get', '/api/recipes/download_shopping_cart/', None
+
+    def recipe_payload(self):
+        return {
+            'ingredients': [
+                {'id': ingredient, 'amount': self.rng.randint(1, 500)}
+                for ingredient, _ in self.rng.sample(self.ingredients, 5)
+            ],
+            'tags': list(Tag.objects.filter(
+                slug__in=self.rng.sample(self.tags, 1)
+            ).values_list('id', flat=True)),
+            'name': 'Рецепт для нагрузочного теста',
+            'text': 'Описание',
+            'cooking_time': self.rng.randint(5, 120),
+            'image': IMAGE,
+        }
+
+    def recipe_create(self, user):
+        return 'post', '/api/recipes/', self.recipe_payload()
+
+    def recipe_update(self, user):
+        recipe = self.own_recipes.get(user.id)
+        if recipe is None:
+            recipe = Recipe.objects.filter(author=user).values_list(
+                'id', flat=True
+            ).first()
+            self.own_recipes[user.id] = recipe
+        if recipe is None:
+            return self.recipe_create(user)
+        return 'patch', f'/api/recipes/{recipe}/', self.recipe_payload()
+
+    USERS = {
+        'subscriptions': 'readers',
+        'download_shopping_cart': 'buyers',
+    }
+    NAMES = (
+        'recipe_list', 'recipe_list_filtered', 'recipe_search',
+        'recipe_detail', 'ingredient_autocomplete', 'subscriptions',
+        'download_shopping_cart', 'recipe_create', 'recipe_update',
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочное тестирование эндпойнтов API через тестовый клиент '
+        'Django: задержки p50/p95/p99 и запросы в секунду по сценариям, '
+        'результат сохраняется в JSON для сравнения запусков. Сценарии '
+        'создания и изменения рецептов меняют данные в базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Количество запросов в каждом сценарии'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Количество запросов прогрева перед замером'
+        )
+        parser.add_argument(
+            '--scenario', action='append', choices=Scenarios.NAMES,
+            help='Сценарий для запуска, по умолчанию все'
+        )
+        parser.add_argument(
+            '--output', help='Путь к JSON файлу с результатами'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        scenarios = Scenarios(rng)
+        users = list(User.objects.filter(
+            pk__in=scenarios.readers + scenarios.buyers
+        )) or list(User.objects.all()[:50])
+        clients = {user.id: self.client(user) for user in users}
+        results = {}
+        # Картинки рецептов, созданных сценариями, сохраняются во
+        # временный каталог, а не в MEDIA_ROOT проекта.
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                MEDIA_ROOT=media_root,
+            ):
+                for name in options['scenario'] or Scenarios.NAMES:
+                    pool = getattr(
+                        scenarios, Scenarios.USERS.get(name, ''), None
+                    )
+                    candidates = [
+                        user for user in users if not pool or user.id in pool
+                    ] or users
+                    results[name] = self.run(
+                        getattr(scenarios, name), candidates, clients, rng,
+                        options['requests'], options['warmup']
+                    )
+                    self.report(name, results[name])
+        report = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'options': {
+                key: options[key]
+                for key in ('requests', 'warmup', 'seed')
+            },
+            'data': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты сохранены в {options["output"]}'
+            ))
+
+    def client(self, user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def run(self, scenario, users, clients, rng, requests, warmup):
+        durations = []
+        errors = 0
+        started = time.perf_counter()
+        for number in range(warmup + requests):
+            if number == warmup:
+                durations.clear()
+                errors = 0
+                started = time.perf_counter()
+            user = rng.choice(users)
+            method, url, data = scenario(user)
+            request_started = time.perf_counter()
+            response = getattr(clients[user.id], method)(
+                url, data, format='json'
+            )
+            if response.streaming:
+                b''.join(response.streaming_content)
+            durations.append(time.perf_counter() - request_started)
+            if response.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+        durations.sort()
+        return {
+            'requests': len(durations),
+            'errors': errors,
+            'rps': round(len(durations) / elapsed, 1) if elapsed else None,
+            'mean_ms': round(sum(durations) / len(durations) * 1000, 2),
+            'p50_ms': round(percentile(durations, 50) * 1000, 2),
+            'p95_ms': round(percentile(durations, 95) * 1000, 2),
+            'p99_ms': round(percentile(durations, 99) * 1000, 2),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<25} p50 {result["p50_ms"]:>8} мс  '
+            f'p95 {result["p95_ms"]:>8} мс  p99 {result["p99_ms"]:>8} мс  '
+            f'{result["rps"]:>8} зап/с  ошибок {result["errors"]}'
+        )
@@ -0,0 +1,217 @@
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappush, heappushpop
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from recipes.models import RecipeIngredient, RecipeTag, SimilarRecipe
+
+INGREDIENTS_WEIGHT = 0.8
+TAGS_WEIGHT = 0.2
+FALLBACK_INGREDIENTS = 3
+
+worker_data = None
+
+
+def init_worker(data):
+    global worker_data
+    worker_data = data
+
+
+def jaccard(shared, left, right):
+    union = left + right - shared
+    return shared / union if union else 0.0
+
+
+def find_candidates(recipe, own, postings, frequent, top):
+    """
+    Возвращает кандидатов с числом общих нечастых ингредиентов и списки
+    рецептов частых ингредиентов рецепта.
+    """
+    shared = Counter()
+    own_frequent = []
+    for ingredient in own:
+        if ingredient in frequent:
+            own_frequent.append(frequent[ingredient])
+        else:
+            shared.update(postings[ingredient])
+    shared.pop(recipe, None)
+    if len(shared) < top:
+        for posting in sorted(own_frequent, key=len)[:FALLBACK_INGREDIENTS]:
+            for candidate in posting:
+                if candidate not in shared and candidate != recipe:
+                    shared[candidate] = 0
+    return shared, own_frequent
+
+
+def similar_for_chunk(recipes, top):
+    """
+    Похожие рецепты для части рецептов. Пересечения наборов ингредиентов
+    со всеми рецептами считаются разреженно, по спискам рецептов каждого
+    ингредиента, как произведение строки матрицы рецепт x ингредиент на
+    транспонированную матрицу. Кандидаты перебираются по убыванию числа
+    общих ингредиентов, пока оценка сверху не станет меньше худшего из
+    уже найденных. Слишком частые ингредиенты не порождают кандидатов,
+    но учитываются в сходстве. Если кандидатов меньше top (например,
+    рецепт состоит только из соли, воды и муки), кандидаты добавляются из
+    списков FALLBACK_INGREDIENTS самых редких частых ингредиентов рецепта.
+    """
+    ingredients, postings, frequent, tags = worker_data
+    rows = []
+    for recipe in recipes:
+        own = ingredients[recipe]
+        shared, own_frequent = find_candidates(
+            recipe, own, postings, frequent, top
+        )
+        own_tags = tags.get(recipe, frozenset())
+        best = []
+        for candidate, count in sorted(
+            shared.items(), key=itemgetter(1), reverse=True
+        ):
+            bound = (
+                INGREDIENTS_WEIGHT * (count + len(own_frequent)) / len(own)
+                + TAGS_WEIGHT
+            )
+            if len(best) == top and best[0][0] > bound:
+                break
+            count += sum(candidate in posting for posting in own_frequent)
+            candidate_tags = tags.get(candidate, frozenset())
+            score = (
+                INGREDIENTS_WEIGHT * jaccard(
+                    count, len(own), len(ingredients[candidate])
+                )
+                + TAGS_WEIGHT * jaccard(
+                    len(own_tags & candidate_tags),
+                    len(own_tags),
+                    len(candidate_tags)
+                )
+            )
+            if len(best) < top:
+                heappush(best, (score, candidate))
+            elif (score, candidate) > best[0]:
+                heappushpop(best, (score, candidate))
+        for position, (score, candidate) in enumerate(
+            sorted(best, reverse=True)
+        ):
+            rows.append((recipe, candidate, position, score))
+    return rows
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = (
+        'Расчёт списков похожих рецептов по сходству наборов ингредиентов '
+        'и тегов. Результат сохраняется в таблицу похожих рецептов, '
+        'команду нужно периодически запускать повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Количество похожих рецептов для каждого рецепта'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Количество процессов для расчёта'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Количество рецептов в одной задаче процесса'
+        )
+        parser.add_argument(
+            '--max-frequency',
+            type=float,
+            default=0.2,
+            help=(
+                'Доля рецептов, начиная с которой ингредиент не используется '
+                'для поиска кандидатов'
+            )
+        )
+
+    def load(self, max_frequency):
+        ingredients = defaultdict(tuple)
+        postings = defaultdict(list)
+        for recipe, ingredient in RecipeIngredient.objects.order_by(
+            'recipe_id', 'ingredient_id'
+        ).values_list('recipe_id', 'ingredient_id').iterator():
+            ingredients[recipe] += (ingredient,)
+            postings[ingredient].append(recipe)
+        tags = defaultdict(set)
+        for recipe, tag in RecipeTag.objects.values_list(
+            'recipe_id', 'tag_id'
+        ).iterator():
+            tags[recipe].add(tag)
+        limit = max(1, int(len(ingredients) * max_frequency))
+        frequent = {
+            ingredient: frozenset(recipes)
+            for ingredient, recipes in postings.items()
+            if len(recipes) > limit
+        }
+        return (
+            dict(ingredients),
+            {
+                ingredient: recipes for ingredient, recipes in
+                postings.items() if ingredient not in frequent
+            },
+            frequent,
+            {recipe: frozenset(tag_ids) for recipe, tag_ids in tags.items()},
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        data = self.load(options['max_frequency'])
+        recipes = sorted(data[0])
+        chunks = list(chunked(recipes, options['chunk_size']))
+        tops = [options['top']] * len(chunks)
+        if options['workers'] > 1 and len(chunks) > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(
+                options['workers'],
+                initializer=init_worker,
+                initargs=(data,)
+            ) as executor:
+                created = self.save(
+                    executor.map(similar_for_chunk, chunks, tops)
+                )
+        else:
+            init_worker(data)
+            created = self.save(map(similar_for_chunk, chunks, tops))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов: {len(recipes)}, сохранено похожих: {created}, '
+            f'{elapsed:.2f} с'
+        ))
+
+    @transaction.atomic
+    def save(self, results):
+        """
+        Заменяет сохранённые списки похожих рецептов результатами расчёта
+        в одной транзакции, по мере их получения от процессов.
+        """
+        SimilarRecipe.objects.all().delete()
+        created = 0
+        for rows in results:
+            SimilarRecipe.objects.bulk_create(
+                SimilarRecipe(
+                    recipe_id=recipe,
+                    similar_id=similar,
+                    position=position,
+                    score=score,
+                ) for recipe, similar, position, score in rows
+            )
+            created += len(rows)
+        return created
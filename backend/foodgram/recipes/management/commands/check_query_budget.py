@@ -0,0 +1,524 @@
+import io
+import json
+import os
+import tempfile
+import traceback
+from collections import Counter, namedtuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.feed import backfill_feed
+from recipes.management.commands.benchmark import IMAGE
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipePopularity,
+    ShoppingList, SimilarRecipe, Tag,
+)
+from users.models import Follow, User
+
+# На малом объёме данных страницы списков короче, а в рецептах и
+# запросах на создание и изменение рецепта меньше ингредиентов: запросы на
+# каждый объект страницы или ингредиент меняют общее количество запросов и
+# не проходят проверку.
+SMALL_PAGE_SIZE = 2
+LARGE_PAGE_SIZE = 6
+
+Endpoint = namedtuple(
+    'Endpoint', 'name method url budget data anonymous',
+    defaults=(None, False),
+)
+
+
+def recipe_payload(ingredients, amount, tags):
+    return {
+        'ingredients': [
+            {'id': ingredient, 'amount': amount}
+            for ingredient in ingredients
+        ],
+        'tags': tags,
+        'name': 'Рецепт для проверки запросов',
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': IMAGE,
+    }
+
+
+def create_payload(params):
+    return recipe_payload(
+        params['create_ingredients'], 10, params['tag_ids'][:1]
+    )
+
+
+def update_payload(params):
+    """
+    Изменение рецепта затрагивает все ветки обновления: часть ингредиентов
+    убирается, у оставшихся меняется количество, добавляются новые, теги
+    заменяются.
+    """
+    return recipe_payload(
+        params['update_ingredients'], 20, params['tag_ids'][1:]
+    )
+
+
+ENDPOINTS = (
+    Endpoint('tags_list', 'get', '/api/tags/', 2),
+    Endpoint('tag_detail', 'get', '/api/tags/{tag_id}/', 2),
+    Endpoint(
+        'ingredients_search', 'get',
+        '/api/ingredients/?name={ingredient_prefix}', 2,
+    ),
+    Endpoint(
+        'ingredient_detail', 'get', '/api/ingredients/{ingredient}/', 2,
+    ),
+    Endpoint(
+        'recipes_list_anonymous', 'get',
+        '/api/recipes/?page=2&limit={limit}', 5, anonymous=True,
+    ),
+    Endpoint('recipes_list', 'get', '/api/recipes/?page=2&limit={limit}', 6),
+    Endpoint(
+        'recipes_cursor', 'get', '/api/recipes/?cursor=&limit={limit}', 5,
+    ),
+    Endpoint(
+        'recipes_by_tags', 'get',
+        '/api/recipes/?tags={tag}&tags={other_tag}&limit={limit}', 7,
+    ),
+    Endpoint(
+        'recipes_by_author', 'get',
+        '/api/recipes/?author={viewer}&limit={limit}', 7,
+    ),
+    Endpoint(
+        'recipes_favorited', 'get',
+        '/api/recipes/?is_favorited=1&limit={limit}', 6,
+    ),
+    Endpoint(
+        'recipes_in_cart', 'get',
+        '/api/recipes/?is_in_shopping_cart=1&limit={limit}', 6,
+    ),
+    Endpoint(
+        'recipes_search', 'get',
+        '/api/recipes/?search={word}&limit={limit}', 6,
+    ),
+    Endpoint(
+        'recipes_popular', 'get',
+        '/api/recipes/?ordering=popular&limit={limit}', 6,
+    ),
+    Endpoint('recipe_detail', 'get', '/api/recipes/{recipe}/', 5),
+    Endpoint('recipe_similar', 'get', '/api/recipes/{recipe}/similar/', 5),
+    Endpoint('recipes_feed', 'get', '/api/recipes/feed/?limit={limit}', 7),
+    Endpoint(
+        'recipes_can_cook', 'get',
+        '/api/recipes/can_cook/?ingredients={ingredient_list}'
+        '&limit={limit}', 6,
+    ),
+    Endpoint(
+        'download_shopping_cart', 'get',
+        '/api/recipes/download_shopping_cart/', 2,
+    ),
+    Endpoint('favorite_add', 'post', '/api/recipes/{recipe}/favorite/', 5),
+    Endpoint(
+        'favorite_remove', 'delete', '/api/recipes/{recipe}/favorite/', 5,
+    ),
+    Endpoint(
+        'cart_add', 'post', '/api/recipes/{recipe}/shopping_cart/', 7,
+    ),
+    Endpoint(
+        'cart_remove', 'delete', '/api/recipes/{recipe}/shopping_cart/', 7,
+    ),
+    Endpoint('recipe_create', 'post', '/api/recipes/', 13, create_payload),
+    # Созданный рецепт добавляется в список покупок, чтобы изменение и
+    # удаление рецепта обновляли суммы списка.
+    Endpoint(
+        'cart_add_created', 'post',
+        '/api/recipes/{created}/shopping_cart/', 7,
+    ),
+    Endpoint(
+        'recipe_update', 'patch', '/api/recipes/{created}/', 20,
+        update_payload,
+    ),
+    Endpoint('recipe_delete', 'delete', '/api/recipes/{created}/', 17),
+    Endpoint('users_list', 'get', '/api/users/?limit={limit}', 4),
+    Endpoint('user_detail', 'get', '/api/users/{author}/', 3),
+    Endpoint('users_me', 'get', '/api/users/me/', 2),
+    Endpoint('subscribe', 'post', '/api/users/{author}/subscribe/', 7),
+    Endpoint(
+        'subscriptions', 'get',
+        '/api/users/subscriptions/?limit={limit}&recipes_limit={limit}', 4,
+    ),
+    Endpoint(
+        'unsubscribe', 'delete', '/api/users/{author}/subscribe/', 5,
+    ),
+)
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN (FORMAT JSON) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+MANAGE_PY = os.path.join(settings.BASE_DIR, 'manage.py')
+DJANGO_DB = os.path.join('django', 'db', '')
+SITE_PACKAGES = os.path.join('site-packages', '')
+Query = namedtuple('Query', 'sql params many site')
+Result = namedtuple('Result', 'status queries')
+
+
+def call_site():
+    """
+    Функция возвращающая ближайшее к запросу место вызова в коде проекта
+    в виде "файл:строка функция". Для запросов, которые выполняет только
+    код библиотек, возвращается ближайший вызов вне django.db.
+    """
+    fallback = None
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = frame.filename
+        if filename in (__file__, MANAGE_PY):
+            continue
+        if (
+            filename.startswith(settings.BASE_DIR)
+            and SITE_PACKAGES not in filename
+        ):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.lineno} {frame.name}'
+        if fallback is None and DJANGO_DB not in filename:
+            fallback = frame
+    path = fallback.filename.split(SITE_PACKAGES)[-1]
+    return f'{path}:{fallback.lineno} {fallback.name}'
+
+
+class QueryRecorder:
+    """
+    Обёртка выполнения запросов, записывающая SQL, параметры и место
+    вызова каждого запроса.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(Query(sql, params, many, call_site()))
+        return execute(sql, params, many, context)
+
+
+def explain(query):
+    """
+    Функция возвращающая план выполнения запроса или None для запросов,
+    которые не являются выборкой.
+    """
+    if query.many or not query.sql.lstrip().upper().startswith('SELECT'):
+        return None
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor, 'EXPLAIN ')
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + query.sql, query.params)
+        if connection.vendor == 'postgresql':
+            return cursor.fetchone()[0]
+        return cursor.fetchall()
+
+
+def seq_scans(plan):
+    """
+    Функция возвращающая таблицы, которые читаются последовательным
+    сканированием в плане PostgreSQL в формате JSON.
+    """
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            yield node['Relation Name']
+        nodes.extend(node.get('Plans', ()))
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка количества SQL запросов эндпойнтов API на двух объёмах '
+        'синтетических данных во временной тестовой базе: количество '
+        'запросов не должно зависеть от объёма данных и превышать бюджет '
+        'эндпойнта. На PostgreSQL планы запросов проверяются на '
+        'последовательное сканирование больших таблиц.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small-users', type=int, default=20)
+        parser.add_argument('--large-users', type=int, default=200)
+        parser.add_argument(
+            '--small-ingredients', type=int, default=3,
+            help='Количество ингредиентов в рецептах на малом объёме данных'
+        )
+        parser.add_argument(
+            '--large-ingredients', type=int, default=12,
+            help='Количество ингредиентов в рецептах на большом объёме '
+                 'данных'
+        )
+        parser.add_argument(
+            '--large-table-rows', type=int, default=1000,
+            help='Количество строк, начиная с которого таблица считается '
+                 'большой и не должна сканироваться последовательно'
+        )
+        parser.add_argument(
+            '--endpoint', action='append',
+            choices=[endpoint.name for endpoint in ENDPOINTS],
+            help='Эндпойнт для проверки, по умолчанию все'
+        )
+        parser.add_argument(
+            '--plans', action='store_true',
+            help='Вывести планы всех запросов на большом объёме данных'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false',
+            dest='interactive',
+            help='Не спрашивать подтверждения на удаление тестовой базы'
+        )
+
+    def handle(self, *args, **options):
+        if options['small_users'] >= options['large_users']:
+            raise CommandError(
+                '--large-users должно быть больше --small-users'
+            )
+        if not 2 <= options['small_ingredients'] < options[
+            'large_ingredients'
+        ]:
+            raise CommandError(
+                '--large-ingredients должно быть больше --small-ingredients, '
+                'а --small-ingredients - не меньше 2'
+            )
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=not options['interactive'],
+            serialize=False,
+        )
+        try:
+            # Картинки создаваемых рецептов сохраняются во временный
+            # каталог, а не в MEDIA_ROOT проекта.
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(
+                    CACHES={'default': {
+                        'BACKEND': 'django.core.cache.backends.locmem.'
+                                   'LocMemCache',
+                        'LOCATION': 'query-budget',
+                    }},
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                    MEDIA_ROOT=media_root,
+                ):
+                    failures = self.check_endpoints(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        if failures:
+            raise CommandError(
+                'Проверку не прошли: ' + ', '.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все эндпойнты в бюджете'))
+
+    def check_endpoints(self, options):
+        endpoints = [
+            endpoint for endpoint in ENDPOINTS
+            if not options['endpoint'] or endpoint.name in options['endpoint']
+        ]
+        self.seed(
+            options['small_users'], options['seed'],
+            options['small_ingredients']
+        )
+        small = self.run(
+            endpoints, SMALL_PAGE_SIZE, options['small_ingredients']
+        )
+        self.seed(
+            options['large_users'] - options['small_users'],
+            options['seed'] + 1, options['large_ingredients']
+        )
+        large = self.run(
+            endpoints, LARGE_PAGE_SIZE, options['large_ingredients']
+        )
+        large_tables = self.large_tables(options['large_table_rows'])
+        failures = []
+        for endpoint in endpoints:
+            problems = self.problems(
+                endpoint, small[endpoint.name], large[endpoint.name],
+                large_tables
+            )
+            self.stdout.write('{:<25} {:>4} {:>4} {:>4}  {}'.format(
+                endpoint.name,
+                len(small[endpoint.name].queries),
+                len(large[endpoint.name].queries),
+                endpoint.budget,
+                self.style.ERROR('FAIL') if problems
+                else self.style.SUCCESS('OK'),
+            ))
+            if problems:
+                failures.append(endpoint.name)
+                self.report(problems, small[endpoint.name],
+                            large[endpoint.name])
+            if options['plans']:
+                self.print_plans(large[endpoint.name])
+        return failures
+
+    def seed(self, users, seed, ingredients):
+        call_command(
+            'seed_data', users=users, seed=seed,
+            ingredients_per_recipe=ingredients, stdout=io.StringIO()
+        )
+        RecipePopularity.objects.bulk_create(
+            [
+                RecipePopularity(recipe_id=recipe, score=favorites)
+                for recipe, favorites in Recipe.objects.values_list(
+                    'id', 'favorites_count'
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def prepare(self, ingredient_count):
+        """
+        Выбирает пользователя, от имени которого выполняются запросы, и
+        объекты для адресов эндпойнтов. Пользователь - автор с наибольшим
+        числом рецептов, у него есть подписки, избранное и список покупок.
+        Рецепт для списка покупок - последний созданный, в нём
+        ingredient_count ингредиентов, как и в запросах на создание и
+        изменение рецепта.
+        """
+        viewer = User.objects.get(pk=Recipe.objects.values('author').annotate(
+            recipes=Count('id')
+        ).order_by('-recipes', 'author')[0]['author'])
+        for author in Follow.objects.filter(
+            follower=viewer
+        ).values_list('following', flat=True):
+            backfill_feed(viewer.id, author)
+        recipe = Recipe.objects.exclude(author=viewer).exclude(
+            pk__in=Favorite.objects.filter(user=viewer).values('recipe')
+        ).exclude(
+            pk__in=ShoppingList.objects.filter(user=viewer).values('recipe')
+        ).order_by('-id').first()
+        SimilarRecipe.objects.filter(recipe=recipe).delete()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(
+                recipe=recipe, similar_id=similar, position=position,
+                score=1 / (position + 1),
+            )
+            for position, similar in enumerate(Recipe.objects.exclude(
+                pk=recipe.pk
+            ).order_by('-id').values_list('id', flat=True)[:5])
+        )
+        author = User.objects.exclude(pk=viewer.pk).exclude(
+            pk__in=Follow.objects.filter(
+                follower=viewer
+            ).values('following')
+        ).filter(pk__in=Recipe.objects.values('author')).first()
+        ingredients = list(RecipeIngredient.objects.filter(
+            recipe__author=viewer
+        ).values_list('ingredient', flat=True)[:3])
+        tags = list(Tag.objects.order_by('id').values_list('id', 'slug')[:2])
+        shift = ingredient_count // 2
+        payload_ingredients = list(Ingredient.objects.order_by(
+            'id'
+        ).values_list('id', flat=True)[:ingredient_count + shift])
+        return viewer, {
+            'viewer': viewer.id,
+            'recipe': recipe.id,
+            'author': author.id,
+            'created': 0,
+            'tag_id': tags[0][0],
+            'tag_ids': [tag for tag, _ in tags],
+            'tag': tags[0][1],
+            'other_tag': tags[-1][1],
+            'ingredient': ingredients[0],
+            'create_ingredients': payload_ingredients[:ingredient_count],
+            'update_ingredients': payload_ingredients[shift:],
+            'ingredient_list': ','.join(map(str, ingredients)),
+            'ingredient_prefix': Ingredient.objects.get(
+                pk=ingredients[0]
+            ).name[:2],
+            'word': Recipe.objects.filter(
+                pk=recipe.id
+            ).values_list('name', flat=True)[0].split()[0],
+        }
+
+    def run(self, endpoints, page_size, ingredient_count):
+        viewer, params = self.prepare(ingredient_count)
+        params['limit'] = page_size
+        token, _ = Token.objects.get_or_create(user=viewer)
+        clients = {False: APIClient(), True: APIClient()}
+        clients[False].credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        results = {}
+        for endpoint in endpoints:
+            cache.clear()
+            recorder = QueryRecorder()
+            client = clients[endpoint.anonymous]
+            data = endpoint.data(params) if endpoint.data else None
+            with connection.execute_wrapper(recorder):
+                response = getattr(client, endpoint.method)(
+                    endpoint.url.format(**params), data, format='json'
+                )
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            if endpoint.name == 'recipe_create':
+                params['created'] = response.data.get('id', 0)
+            results[endpoint.name] = Result(
+                response.status_code, recorder.queries
+            )
+        return results
+
+    def large_tables(self, rows):
+        return {
+            model._meta.db_table for model in apps.get_models()
+            if model.objects.count() >= rows
+        }
+
+    def problems(self, endpoint, small, large, large_tables):
+        problems = []
+        for result in (small, large):
+            if result.status >= 400:
+                problems.append(f'ответ с ошибкой {result.status}')
+        if len(small.queries) != len(large.queries):
+            problems.append(
+                'количество запросов зависит от объёма данных: '
+                f'{len(small.queries)} -> {len(large.queries)}'
+            )
+        if max(len(small.queries), len(large.queries)) > endpoint.budget:
+            problems.append(f'превышен бюджет {endpoint.budget}')
+        if connection.vendor != 'postgresql':
+            return problems
+        for query in large.queries:
+            plan = explain(query)
+            if plan is None:
+                continue
+            for table in set(seq_scans(plan)) & large_tables:
+                problems.append(
+                    f'последовательное сканирование {table} в '
+                    f'{query.site}:\n    {query.sql}'
+                )
+        return problems
+
+    def report(self, problems, small, large):
+        for problem in problems:
+            self.stdout.write(f'  {problem}')
+        small_sites = Counter(query.site for query in small.queries)
+        large_sites = Counter(query.site for query in large.queries)
+        samples = {query.site: query.sql for query in large.queries}
+        samples.update(
+            (query.site, query.sql) for query in small.queries
+            if query.site not in samples
+        )
+        for site, _ in (large_sites + small_sites).most_common():
+            self.stdout.write(
+                f'  {site}: {small_sites[site]} -> {large_sites[site]}\n'
+                f'    {samples[site]}'
+            )
+
+    def print_plans(self, result):
+        for query in result.queries:
+            plan = explain(query)
+            if plan is None:
+                continue
+            self.stdout.write(f'  {query.site}\n    {query.sql}')
+            if connection.vendor == 'postgresql':
+                lines = json.dumps(plan, indent=2).splitlines()
+            else:
+                lines = [' '.join(map(str, row)) for row in plan]
+            for line in lines:
+                self.stdout.write(f'      {line}')
@@ -0,0 +1,195 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import bump_version
+from api.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+FIELDS = ('name', 'measurement_unit')
+
+
+def read_csv(file):
+    """
+    Построчное чтение CSV файла с ингредиентами. Строка заголовка
+    пропускается, если она есть.
+    """
+    for row in csv.reader(file):
+        if not row or tuple(row) == FIELDS:
+            continue
+        name, measurement_unit = row[:2]
+        yield name, measurement_unit
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """
+    Потоковое чтение JSON массива ингредиентов: объекты разбираются по мере
+    чтения файла, файл целиком в память не загружается.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if not started and buffer:
+            if buffer[0] != '[':
+                raise CommandError('Ожидается JSON массив ингредиентов')
+            started = True
+            buffer = buffer[1:].lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except ValueError:
+            if eof:
+                if buffer:
+                    raise CommandError('Некорректный JSON файл')
+                return
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield obj['name'], obj['measurement_unit']
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class CopyStream(io.TextIOBase):
+    """
+    Файлоподобный объект, отдающий строки в формате CSV для команды COPY.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = ''
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def _line(self, row):
+        out = io.StringIO()
+        csv.writer(out).writerow(row)
+        return out.getvalue()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self.count += 1
+            self._buffer += self._line(row)
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузка ингредиентов из CSV или JSON файла. Повторный запуск '
+        'не создаёт дубликатов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv или .json')
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла, по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество строк, читаемых из файла за одну пачку'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY на PostgreSQL'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        )
+        readers = {'csv': read_csv, 'json': read_json}
+        if file_format not in readers:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if not os.path.exists(path):
+            raise CommandError(f'Файл не найден: {path}')
+        before = Ingredient.objects.count()
+        started = time.monotonic()
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = readers[file_format](file)
+            if connection.vendor == 'postgresql' and not options['no_copy']:
+                processed = self.copy_rows(rows)
+            else:
+                processed = self.bulk_create_rows(
+                    rows, options['batch_size']
+                )
+        created = Ingredient.objects.count() - before
+        if created:
+            # Массовая вставка не отправляет сигналы, поэтому кеши
+            # ингредиентов и индекс автодополнения сбрасываются здесь.
+            bump_version(Ingredient)
+            ingredient_index.invalidate()
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else processed
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, добавлено ингредиентов: '
+            f'{created}, {elapsed:.2f} с, {rate:.0f} строк/с'
+        ))
+
+    def bulk_create_rows(self, rows, batch_size):
+        processed = 0
+        with transaction.atomic():
+            for chunk in chunked(rows, batch_size):
+                Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(
+                            name=name, measurement_unit=measurement_unit
+                        ) for name, measurement_unit in chunk
+                    ],
+                    ignore_conflicts=True,
+                )
+                processed += len(chunk)
+        return processed
+
+    def copy_rows(self, rows):
+        table = Ingredient._meta.db_table
+        stream = CopyStream(rows)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                stream
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+        return stream.count
@@ -0,0 +1,364 @@
+import gc
+import json
+import math
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+from django.test.utils import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.filters import IngredientFilter, ResipeFilter
+from api.permissions import IsAuthor, ReadOnly
+from api.serializers import (
+    FollowUnfollowSerializer, ReadRecipeSerializer, WriteRecipeSerializer,
+)
+from api.views import RecipeViewSet
+from recipes.management.commands.benchmark import IMAGE
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+TAGS = 6
+INGREDIENTS = 100
+INGREDIENTS_PER_RECIPE = 8
+RECIPE_FILTERS = (
+    'tags=tag0&tags=tag1',
+    'is_favorited=1&is_in_shopping_cart=0',
+    'author=1&tags=tag2',
+    'search=быстрый суп',
+)
+
+
+def prefetched(instance, name, objects):
+    """
+    Функция сохраняющая объекты в кеш prefetch_related экземпляра, чтобы
+    менеджер связанных объектов возвращал их без запроса к базе.
+    """
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[name] = queryset
+
+
+def summary(times, db_times, queries, batch, number):
+    median = statistics.median(times)
+    return {
+        'batch': batch,
+        'rounds': len(times),
+        'number': number,
+        'min_ms': round(min(times) * 1000, 4),
+        'median_ms': round(median * 1000, 4),
+        'mean_ms': round(statistics.mean(times) * 1000, 4),
+        'stdev_ms': round(
+            statistics.stdev(times) * 1000 if len(times) > 1 else 0.0, 4
+        ),
+        'per_item_us': round(median / batch * 1e6, 2),
+        'db_ms': round(statistics.median(db_times) * 1000, 4),
+        'cpu_ms': round((median - statistics.median(db_times)) * 1000, 4),
+        'queries': queries,
+    }
+
+
+class DatabaseTimer:
+    """
+    Обёртка выполнения запросов, суммирующая их количество и время.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.duration += time.perf_counter() - started
+
+
+class Benchmarks:
+    """
+    Наборы данных и измеряемые операции. Рецепты, пользователи и теги
+    создаются в памяти с заполненным кешем prefetch_related, ингредиенты
+    загружаются миграцией в тестовую базу. Теги и пользователь
+    записываются в базу для валидации данных создания рецепта.
+    """
+
+    NAMES = (
+        'read_recipe_serializer', 'write_recipe_serializer_validate',
+        'write_recipe_serializer_represent', 'follow_unfollow_serializer',
+        'recipe_filter', 'ingredient_filter', 'author_or_read_only',
+    )
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.tags = [
+            Tag(id=number + 1, name=f'Тег {number}', color=f'#0000{number:02}',
+                slug=f'tag{number}')
+            for number in range(TAGS)
+        ]
+        self.ingredients = list(
+            Ingredient.objects.order_by('id')[:INGREDIENTS]
+        )
+        self.viewer = User(id=1, username='viewer', email='viewer@example.com',
+                           first_name='Viewer', last_name='Viewer')
+        self.authors = [
+            User(id=number + 2, username=f'author{number}',
+                 email=f'author{number}@example.com',
+                 first_name='Author', last_name=f'{number}',
+                 recipes_count=3)
+            for number in range(batch)
+        ]
+        self.recipes = [
+            self.recipe(number, self.authors[number % len(self.authors)])
+            for number in range(batch)
+        ]
+        for author in self.authors:
+            author.is_subscribed = author.id % 2 == 0
+            author.limited_recipes = [
+                recipe for recipe in self.recipes[:3]
+            ]
+        factory = APIRequestFactory()
+        self.get_request = self.request(factory.get('/api/recipes/'))
+        self.patch_request = self.request(factory.patch('/api/recipes/1/'))
+        self.payloads = [
+            {
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 10 + position}
+                    for position, ingredient in enumerate(
+                        self.ingredients[number % 50:][:INGREDIENTS_PER_RECIPE]
+                    )
+                ],
+                'tags': [tag.id for tag in self.tags[:2]],
+                'name': f'Рецепт {number}',
+                'text': 'Описание рецепта',
+                'cooking_time': 30,
+                'image': IMAGE,
+            }
+            for number in range(batch)
+        ]
+        view = RecipeViewSet(
+            request=self.get_request, action='list', format_kwarg=None
+        )
+        self.recipe_queryset = view.get_queryset()
+
+    def request(self, request):
+        request = Request(request)
+        request.user = self.viewer
+        return request
+
+    def recipe(self, number, author):
+        recipe = Recipe(
+            id=number + 1, author=author, name=f'Рецепт {number}',
+            text='Описание рецепта ' * 20, image='recipes/images/seed.png',
+            cooking_time=30,
+        )
+        recipe.is_favorited = number % 2 == 0
+        recipe.is_in_shopping_cart = number % 3 == 0
+        recipe.author_is_subscribed = number % 5 == 0
+        prefetched(recipe, 'tags', self.tags[number % TAGS:][:2])
+        prefetched(recipe, 'recipeingredient_set', [
+            RecipeIngredient(
+                id=number * INGREDIENTS_PER_RECIPE + position + 1,
+                recipe=recipe, ingredient=ingredient, amount=position + 1,
+            )
+            for position, ingredient in enumerate(
+                self.ingredients[number % 50:][:INGREDIENTS_PER_RECIPE]
+            )
+        ])
+        return recipe
+
+    def create_fixtures(self):
+        Tag.objects.bulk_create(self.tags)
+        User.objects.bulk_create([self.viewer])
+
+    def context(self, request=None):
+        return {'request': request or self.get_request}
+
+    def read_recipe_serializer(self):
+        return ReadRecipeSerializer(
+            self.recipes, many=True, context=self.context()
+        ).data
+
+    def write_recipe_serializer_validate(self):
+        for payload in self.payloads:
+            serializer = WriteRecipeSerializer(
+                data=payload, context=self.context(self.patch_request)
+            )
+            if not serializer.is_valid():
+                raise CommandError(serializer.errors)
+
+    def write_recipe_serializer_represent(self):
+        return WriteRecipeSerializer(
+            self.recipes, many=True, context=self.context(self.patch_request)
+        ).data
+
+    def follow_unfollow_serializer(self):
+        return FollowUnfollowSerializer(
+            self.authors, many=True, context=self.context()
+        ).data
+
+    def recipe_filter(self):
+        for number in range(self.batch):
+            query = RECIPE_FILTERS[number % len(RECIPE_FILTERS)]
+            queryset = ResipeFilter(
+                data=QueryDict(query), queryset=self.recipe_queryset,
+                request=self.get_request,
+            ).qs
+            queryset.query.sql_with_params()
+
+    def ingredient_filter(self):
+        for ingredient in self.ingredients[:self.batch]:
+            IngredientFilter(
+                data={'name': ingredient.name[:3]},
+                queryset=Ingredient.objects.all(),
+            ).qs.query.sql_with_params()
+
+    def author_or_read_only(self):
+        permission = (IsAuthor | ReadOnly)()
+        for number, recipe in enumerate(self.recipes):
+            request = self.patch_request if number % 2 else self.get_request
+            if permission.has_permission(request, None):
+                permission.has_object_permission(request, None, recipe)
+
+
+class Command(BaseCommand):
+    help = (
+        'Микробенчмарки сериализаторов, фильтров и проверки прав на '
+        'объектах в памяти: прогрев, несколько раундов, медиана и разброс '
+        'времени, время и количество SQL запросов отдельно от времени '
+        'процессора. Результат сохраняется в JSON для сравнения коммитов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch', type=int, default=100,
+            help='Количество объектов в одной операции'
+        )
+        parser.add_argument('--rounds', type=int, default=10)
+        parser.add_argument(
+            '--min-round-ms', type=float, default=50,
+            help='Минимальная длительность раунда: количество операций в '
+                 'раунде подбирается по времени прогрева'
+        )
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--benchmark', action='append', choices=Benchmarks.NAMES,
+            help='Бенчмарк для запуска, по умолчанию все'
+        )
+        parser.add_argument(
+            '--output', help='Путь к JSON файлу с результатами'
+        )
+        parser.add_argument(
+            '--compare', help='JSON файл предыдущего запуска для сравнения'
+        )
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false',
+            dest='interactive',
+            help='Не спрашивать подтверждения на удаление тестовой базы'
+        )
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['results']
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=not options['interactive'],
+            serialize=False,
+        )
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            ):
+                benchmarks = Benchmarks(options['batch'])
+                benchmarks.create_fixtures()
+                results = {}
+                for name in options['benchmark'] or Benchmarks.NAMES:
+                    results[name] = self.measure(
+                        getattr(benchmarks, name), options
+                    )
+                    self.report(name, results[name], previous)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'started_at': datetime.now().isoformat(timespec='seconds'),
+                    'commit': self.commit(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'options': {
+                        key: options[key]
+                        for key in (
+                            'batch', 'rounds', 'min_round_ms', 'warmup',
+                        )
+                    },
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты сохранены в {options["output"]}'
+            ))
+
+    def measure(self, operation, options):
+        duration = 0.0
+        for _ in range(max(options['warmup'], 1)):
+            started = time.perf_counter()
+            operation()
+            duration = time.perf_counter() - started
+        number = max(1, math.ceil(
+            options['min_round_ms'] / 1000 / max(duration, 1e-9)
+        ))
+        times = []
+        db_times = []
+        queries = 0
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(options['rounds']):
+                timer = DatabaseTimer()
+                with connection.execute_wrapper(timer):
+                    started = time.perf_counter()
+                    for _ in range(number):
+                        operation()
+                    elapsed = time.perf_counter() - started
+                times.append(elapsed / number)
+                db_times.append(timer.duration / number)
+                queries = timer.queries // number
+        finally:
+            gc.enable()
+        return summary(times, db_times, queries, options['batch'], number)
+
+    def report(self, name, result, previous):
+        line = (
+            f'{name:<35} {result["median_ms"]:>10.3f} мс '
+            f'± {result["stdev_ms"]:>7.3f}  '
+            f'{result["per_item_us"]:>9.2f} мкс/объект  '
+            f'SQL {result["queries"]:>3} ({result["db_ms"]:.3f} мс)'
+        )
+        if previous and name in previous:
+            change = result['median_ms'] / previous[name]['median_ms'] - 1
+            line += f'  {change:+.1%}'
+        self.stdout.write(line)
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+            ).stdout.strip() or None
+        except OSError:
+            return None
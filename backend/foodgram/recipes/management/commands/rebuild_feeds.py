@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from api.feed import BACKFILL_RECIPES, FANOUT_FOLLOWERS_LIMIT, chunked
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow, User
+
+FEED_CHUNK_SIZE = 1000
+
+
+def stale_entries():
+    """
+    Рецепты в лентах авторов, на которых пользователь больше не подписан.
+    """
+    return FeedEntry.objects.annotate(
+        followed=Exists(Follow.objects.filter(
+            follower=OuterRef('user'), following=OuterRef('author')
+        ))
+    ).filter(followed=False)
+
+
+def missing_entries(author):
+    """
+    Недостающие в лентах подписчиков последние BACKFILL_RECIPES рецептов
+    автора: фоновые задачи добавления теряются при перезапуске воркера,
+    а рецепты, опубликованные, пока у автора было больше
+    FANOUT_FOLLOWERS_LIMIT подписчиков, в ленты не копировались.
+    Записи создаются по мере перебора подписчиков пачками, так что в
+    памяти не больше FEED_CHUNK_SIZE уже существующих записей.
+    """
+    recipes = list(Recipe.objects.filter(author=author).order_by(
+        '-id'
+    ).values_list('id', flat=True)[:BACKFILL_RECIPES])
+    if not recipes:
+        return
+    followers = Follow.objects.filter(following=author).order_by(
+        'follower'
+    ).values_list('follower', flat=True)
+    for users in chunked(
+        followers.iterator(), max(1, FEED_CHUNK_SIZE // len(recipes))
+    ):
+        existing = set(FeedEntry.objects.filter(
+            author=author, user__in=users, recipe__in=recipes
+        ).values_list('user', 'recipe'))
+        for user in users:
+            for recipe in recipes:
+                if (user, recipe) not in existing:
+                    yield FeedEntry(
+                        user_id=user, recipe_id=recipe, author_id=author
+                    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка лент подписок с подписками и рецептами авторов: удаление '
+        'рецептов авторов, на которых пользователь не подписан, и '
+        'добавление недостающих последних рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать количество расхождений'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stale = stale_entries().values('pk')
+            stale_count = stale.count()
+            if stale_count and not options['check']:
+                FeedEntry.objects.filter(pk__in=stale).delete()
+        missing_count = 0
+        authors = list(User.objects.filter(
+            followers_count__gt=0,
+            followers_count__lte=FANOUT_FOLLOWERS_LIMIT,
+        ).values_list('id', flat=True))
+        for author in authors:
+            with transaction.atomic():
+                for chunk in chunked(missing_entries(author), FEED_CHUNK_SIZE):
+                    missing_count += len(chunk)
+                    if not options['check']:
+                        FeedEntry.objects.bulk_create(
+                            chunk, ignore_conflicts=True
+                        )
+        self.stdout.write(
+            f'Лишних рецептов в лентах: {stale_count}, '
+            f'недостающих: {missing_count}'
+        )
+        if not options['check']:
+            self.stdout.write(self.style.SUCCESS('Ленты сверены'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.search import missing_search_triggers, restore_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка триггеров полнотекстового поиска рецептов, создание '
+        'отсутствующих и перестроение поискового индекса.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить наличие триггеров'
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            missing = missing_search_triggers()
+            if missing:
+                raise CommandError(
+                    'Нет триггеров поискового индекса: ' + ', '.join(missing)
+                )
+            self.stdout.write(self.style.SUCCESS('Триггеры на месте'))
+            return
+        restored = restore_search_index(rebuild=True)
+        if restored:
+            self.stdout.write(
+                'Созданы триггеры: ' + ', '.join(restored)
+            )
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
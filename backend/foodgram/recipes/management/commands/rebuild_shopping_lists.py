@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from recipes.models import RecipeIngredient, ShoppingListIngredient
+
+
+def aggregate_totals():
+    """
+    Суммы ингредиентов в списках покупок всех пользователей, вычисленные
+    по исходным данным одним запросом.
+    """
+    totals = RecipeIngredient.objects.filter(
+        recipe__shoppinglist__isnull=False
+    ).values(
+        'recipe__shoppinglist__user', 'ingredient'
+    ).annotate(
+        total_amount=Sum('amount'),
+        total_recipes=Count('recipe'),
+    ).values_list(
+        'recipe__shoppinglist__user', 'ingredient', 'total_amount',
+        'total_recipes'
+    ).order_by()
+    return {
+        (user, ingredient): (amount, recipes_count)
+        for user, ingredient, amount, recipes_count in totals.iterator()
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка и пересборка таблицы сумм ингредиентов в списках покупок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = aggregate_totals()
+            stored = {
+                (user, ingredient): (amount, recipes_count)
+                for user, ingredient, amount, recipes_count
+                in ShoppingListIngredient.objects.values_list(
+                    'user', 'ingredient', 'amount', 'recipes_count'
+                ).iterator()
+            }
+            drift = {
+                key for key in expected.keys() | stored.keys()
+                if expected.get(key) != stored.get(key)
+            }
+            if options['check']:
+                if drift:
+                    raise CommandError(f'Найдено расхождений: {len(drift)}')
+                self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+                return
+            if not drift:
+                self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+                return
+            ShoppingListIngredient.objects.all().delete()
+            ShoppingListIngredient.objects.bulk_create(
+                ShoppingListIngredient(
+                    user_id=user,
+                    ingredient_id=ingredient,
+                    amount=amount,
+                    recipes_count=recipes_count,
+                ) for (user, ingredient), (amount, recipes_count)
+                in expected.items()
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Таблица пересобрана: {len(expected)} строк, '
+            f'исправлено расхождений: {len(drift)}'
+        ))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Follow, User
+
+
+def count_subquery(model, field):
+    """
+    Подзапрос, считающий строки model, ссылающиеся полем field
+    на объект внешнего запроса.
+    """
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт счётчиков избранного, рецептов и подписчиков '
+        'с исправлением расхождений.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать количество расхождений'
+        )
+
+    def handle(self, *args, **options):
+        for model, counter, source, field in COUNTERS:
+            with transaction.atomic():
+                drifted = model.objects.annotate(
+                    actual=count_subquery(source, field)
+                ).filter(~Q(**{counter: F('actual')})).values('pk')
+                drift = drifted.count()
+                if drift and not options['check']:
+                    model.objects.filter(pk__in=drifted).update(
+                        **{counter: count_subquery(source, field)}
+                    )
+            self.stdout.write(
+                f'{model._meta.model_name}.{counter}: '
+                f'расхождений {drift}'
+            )
+        if not options['check']:
+            self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
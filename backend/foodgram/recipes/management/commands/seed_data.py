@@ -0,0 +1,204 @@
+import os
+import random
+import time
+import uuid
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import bump_version
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, ShoppingList,
+    Tag,
+)
+from users.models import Follow, User
+
+SEED_PASSWORD = 'seed-password'
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'паста', 'омлет', 'блины',
+    'запеканка', 'котлеты', 'плов', 'борщ', 'соус', 'десерт', 'кекс',
+    'домашний', 'быстрый', 'летний', 'острый', 'сырный', 'овощной',
+    'куриный', 'рыбный', 'грибной', 'шоколадный', 'ягодный', 'постный',
+)
+
+
+def last_pk(model):
+    return model.objects.order_by('-pk').values_list(
+        'pk', flat=True
+    ).first() or 0
+
+
+class ZipfChoice:
+    """
+    Выбор элементов с вероятностью, обратно пропорциональной рангу:
+    немногие авторы и рецепты получают большую часть подписок и
+    добавлений, как в реальных данных.
+    """
+
+    def __init__(self, items, rng, exponent=1.0):
+        self.items = items
+        self.rng = rng
+        self.weights = list(accumulate(
+            1 / (rank + 1) ** exponent for rank in range(len(items))
+        ))
+
+    def sample(self, count, exclude=None):
+        count = min(count, len(self.items) - (exclude is not None))
+        chosen = set()
+        while len(chosen) < count:
+            item = self.rng.choices(
+                self.items, cum_weights=self.weights
+            )[0]
+            if item != exclude:
+                chosen.add(item)
+        return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполнение базы синтетическими данными для нагрузочного '
+        'тестирования: пользователи, рецепты с ингредиентами из '
+        'data/ingredients.csv, теги, подписки, избранное и списки покупок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--recipes-per-user', type=float, default=5,
+            help='Среднее количество рецептов на пользователя'
+        )
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags', type=int, default=6)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=3)
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Начальное значение генератора случайных чисел'
+        )
+
+    def handle(self, *args, **options):
+        if options['tags'] < 1:
+            raise CommandError('Нужен хотя бы один тег')
+        started = time.monotonic()
+        rng = random.Random(options['seed'])
+        if not Ingredient.objects.exists():
+            call_command(
+                'import_ingredients',
+                os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+                stdout=self.stdout,
+            )
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            tags = self.create_tags(options['tags'])
+            recipes = self.create_recipes(users, tags, rng, options)
+            self.create_relations(users, recipes, rng, options)
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        for model in (Tag, Ingredient, RecipeIngredient):
+            bump_version(model)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}, '
+            f'{elapsed:.2f} с. Пароль пользователей: {SEED_PASSWORD}'
+        ))
+
+    def create_users(self, count):
+        # Префикс уникален для запуска: номера по количеству пользователей
+        # совпадали с уже занятыми после удаления любого из них.
+        prefix = f'seed_{uuid.uuid4().hex[:8]}_'
+        last_id = last_pk(User)
+        password = make_password(SEED_PASSWORD)
+        names = [f'{prefix}{number}' for number in range(count)]
+        User.objects.bulk_create(
+            User(
+                username=name,
+                email=f'{name}@example.com',
+                first_name=name.capitalize(),
+                last_name='Тестовый',
+                password=password,
+            ) for name in names
+        )
+        return list(User.objects.filter(
+            pk__gt=last_id
+        ).values_list('id', flat=True))
+
+    def create_tags(self, count):
+        Tag.objects.bulk_create(
+            [
+                Tag(
+                    name=f'Тег {number}',
+                    color=f'#{number:06x}',
+                    slug=f'tag{number}',
+                ) for number in range(count)
+            ],
+            ignore_conflicts=True,
+        )
+        tags = list(Tag.objects.filter(
+            slug__in=[f'tag{number}' for number in range(count)]
+        ).values_list('id', flat=True))
+        if len(tags) < count:
+            raise CommandError(
+                f'Создано тегов: {len(tags)} из {count}. Названия или цвета '
+                'остальных заняты существующими тегами.'
+            )
+        return tags
+
+    def create_recipes(self, users, tags, rng, options):
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        authors = ZipfChoice(users, rng, exponent=0.8)
+        count = int(len(users) * options['recipes_per_user'])
+        last_id = last_pk(Recipe)
+        Recipe.objects.bulk_create(
+            Recipe(
+                author_id=authors.sample(1).pop(),
+                name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                text=' '.join(rng.choices(WORDS, k=40)),
+                image='recipes/images/seed.png',
+                cooking_time=rng.randint(5, 180),
+            ) for _ in range(count)
+        )
+        recipes = list(Recipe.objects.filter(
+            pk__gt=last_id
+        ).values_list('id', flat=True))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe, ingredient_id=ingredient,
+                amount=rng.randint(1, 500),
+            )
+            for recipe in recipes
+            for ingredient in rng.sample(
+                ingredients,
+                min(options['ingredients_per_recipe'], len(ingredients))
+            )
+        )
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, min(3, len(tags))))
+        )
+        return recipes
+
+    def create_relations(self, users, recipes, rng, options):
+        authors = ZipfChoice(users, rng)
+        popular = ZipfChoice(recipes, rng)
+        Follow.objects.bulk_create(
+            Follow(follower_id=user, following_id=author)
+            for user in users
+            for author in authors.sample(
+                options['follows_per_user'], exclude=user
+            )
+        )
+        for model, per_user in (
+            (Favorite, options['favorites_per_user']),
+            (ShoppingList, options['carts_per_user']),
+        ):
+            model.objects.bulk_create(
+                model(user_id=user, recipe_id=recipe)
+                for user in users
+                for recipe in popular.sample(per_user)
+            )
@@ -0,0 +1,99 @@
+import math
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import (
+    Favorite, PopularityCheckpoint, RecipePopularity, ShoppingList,
+)
+
+HALF_LIFE = timedelta(days=7)
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+ACTIVITY_LAG = timedelta(minutes=1)
+ACTIVITY_WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingList, 0.5),
+)
+
+
+def logaddexp(left, right):
+    if left is None:
+        return right
+    high, low = max(left, right), min(left, right)
+    return high + math.log1p(math.exp(low - high))
+
+
+def event_score(created_at, weight):
+    """
+    Логарифм вклада события в популярность. Вклад события убывает вдвое
+    за HALF_LIFE, но вместо уменьшения старых вкладов растёт вклад новых
+    событий относительно EPOCH: порядок рецептов при этом тот же, а
+    сохранённые оценки не нужно пересчитывать.
+    """
+    age = (created_at - EPOCH) / HALF_LIFE
+    return age * math.log(2) + math.log(weight)
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновление популярности рецептов по добавлениям в избранное и в '
+        'список покупок с затуханием со временем. Учитывается только '
+        'активность после предыдущего запуска.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать популярность по всей истории'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        until = timezone.now() - ACTIVITY_LAG
+        with transaction.atomic():
+            checkpoint = PopularityCheckpoint.objects.select_for_update(
+            ).first()
+            if options['full']:
+                RecipePopularity.objects.all().delete()
+            since = None
+            if checkpoint is not None and not options['full']:
+                since = checkpoint.processed_until
+            scores = {}
+            events = 0
+            for model, weight in ACTIVITY_WEIGHTS:
+                activity = model.objects.filter(created_at__lte=until)
+                if since is not None:
+                    activity = activity.filter(created_at__gt=since)
+                for recipe, created_at in activity.values_list(
+                    'recipe_id', 'created_at'
+                ).iterator():
+                    scores[recipe] = logaddexp(
+                        scores.get(recipe), event_score(created_at, weight)
+                    )
+                    events += 1
+            self.save(scores)
+            if checkpoint is None:
+                PopularityCheckpoint.objects.create(processed_until=until)
+            else:
+                checkpoint.processed_until = until
+                checkpoint.save(update_fields=['processed_until'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Событий: {events}, обновлено рецептов: {len(scores)}, '
+            f'{elapsed:.2f} с'
+        ))
+
+    def save(self, scores):
+        existing = RecipePopularity.objects.in_bulk(list(scores))
+        for recipe, popularity in existing.items():
+            popularity.score = logaddexp(popularity.score, scores[recipe])
+        if existing:
+            RecipePopularity.objects.bulk_update(existing.values(), ['score'])
+        RecipePopularity.objects.bulk_create(
+            RecipePopularity(recipe_id=recipe, score=score)
+            for recipe, score in scores.items() if recipe not in existing
+        )
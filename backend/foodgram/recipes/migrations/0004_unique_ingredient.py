@@ -0,0 +1,52 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:10
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Объединение ингредиентов с одинаковыми названием и единицей измерения,
+    загруженных в базу до появления ограничения уникальности. Остаётся
+    ингредиент с наименьшим id, рецепты переводятся на него, количества
+    одного ингредиента в рецепте складываются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        survivor=Min('id'), total=Count('id'),
+    ).filter(total__gt=1)
+    for group in duplicates:
+        survivor = group['survivor']
+        others = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit'],
+        ).exclude(id=survivor)
+        for item in RecipeIngredient.objects.filter(ingredient__in=others):
+            merged = RecipeIngredient.objects.filter(
+                recipe_id=item.recipe_id, ingredient_id=survivor,
+            ).update(amount=F('amount') + item.amount)
+            if merged:
+                item.delete()
+            else:
+                item.ingredient_id = survivor
+                item.save(update_fields=['ingredient'])
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_auto_20220702_2012'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_list_totals(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListIngredient = apps.get_model(
+        'recipes', 'ShoppingListIngredient'
+    )
+    totals = RecipeIngredient.objects.filter(
+        recipe__shoppinglist__isnull=False
+    ).values(
+        'recipe__shoppinglist__user', 'ingredient'
+    ).annotate(
+        total_amount=models.Sum('amount'),
+        total_recipes=models.Count('recipe'),
+    ).order_by()
+    ShoppingListIngredient.objects.bulk_create(
+        ShoppingListIngredient(
+            user_id=line['recipe__shoppinglist__user'],
+            ingredient_id=line['ingredient'],
+            amount=line['total_amount'],
+            recipes_count=line['total_recipes'],
+        ) for line in totals.iterator()
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0004_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0, verbose_name='Суммарное количество ингредиента')),
+                ('recipes_count', models.IntegerField(default=0, verbose_name='Количество рецептов с ингредиентом')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.Ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Владелец списка покупок')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списке покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_ingredient_in_shopping_list'),
+        ),
+        migrations.RunPython(
+            fill_shopping_list_totals, migrations.RunPython.noop
+        ),
+    ]
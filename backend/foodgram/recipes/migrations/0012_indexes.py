@@ -0,0 +1,50 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+# Django компилирует istartswith в UPPER("name"::text) LIKE UPPER(%s),
+# поэтому индекс строится по тому же выражению. text_pattern_ops нужен
+# для поиска по префиксу при локали базы, отличной от C.
+POSTGRESQL_FORWARD = (
+    'CREATE INDEX recipes_ingredient_name_upper_like '
+    'ON recipes_ingredient (UPPER(name) text_pattern_ops)',
+)
+
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX IF EXISTS recipes_ingredient_name_upper_like',
+)
+
+STATEMENTS = {
+    'postgresql': (POSTGRESQL_FORWARD, POSTGRESQL_BACKWARD),
+}
+
+
+def run_statements(schema_editor, backward=False):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    for sql in statements[backward]:
+        schema_editor.execute(sql)
+
+
+def create_name_index(apps, schema_editor):
+    run_statements(schema_editor)
+
+
+def drop_name_index(apps, schema_editor):
+    run_statements(schema_editor, backward=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-id'], name='recipe_author_id_desc'),
+        ),
+        migrations.RunPython(create_name_index, drop_name_index),
+    ]
@@ -1,7 +1,7 @@
 from django.core.validators import MinValueValidator
 from django.db import models
 
-from users.models import User
+from users.models import CounterFieldsMixin, User
 
 
 class Ingredient(models.Model):
@@ -13,6 +13,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -102,7 +108,7 @@ class RecipeTag(models.Model):
         return f'{self.recipe} содержит тег {self.tag}'
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         verbose_name='Автор рецепта',
@@ -129,11 +135,28 @@ class Recipe(models.Model):
         default=0,
         validators=[MinValueValidator(0)]
     )
+    favorites_count = models.IntegerField(
+        verbose_name='Количество добавлений в избранное',
+        default=0,
+        db_index=True,
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+
+    COUNTER_FIELDS = ('favorites_count',)
 
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['author', '-id'],
+                name='recipe_author_id_desc',
+            ),
+        ]
 
     def __str__(self):
         return f'рецепт {self.name} от {self.author}'
@@ -150,6 +173,11 @@ class Favorite(models.Model):
         verbose_name='Рецепт добавленный в избранное',
         on_delete=models.CASCADE,
     )
+    created_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         ordering = ('-id',)
@@ -177,6 +205,11 @@ class ShoppingList(models.Model):
         verbose_name='Рецепты добавленные в список покупок',
         on_delete=models.CASCADE,
     )
+    created_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Рецепт в списке покупок'
@@ -190,3 +223,153 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.recipe} в списке покупок у {self.user}'
+
+
+class ShoppingListIngredient(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Владелец списка покупок',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE,
+    )
+    amount = models.IntegerField(
+        verbose_name='Суммарное количество ингредиента',
+        default=0,
+    )
+    recipes_count = models.IntegerField(
+        verbose_name='Количество рецептов с ингредиентом',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_ingredient_in_shopping_list',
+            ),
+        ]
+
+    def __str__(self):
+        return (f'{self.ingredient.name}, {self.amount} '
+                f'{self.ingredient.measurement_unit} в списке покупок '
+                f'у {self.user}')
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='similar_recipes',
+        on_delete=models.CASCADE,
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        verbose_name='Похожий рецепт',
+        related_name='similar_to',
+        on_delete=models.CASCADE,
+    )
+    position = models.PositiveSmallIntegerField(
+        verbose_name='Место в списке похожих',
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        ordering = ('recipe', 'position')
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'position'],
+                name='unique_similar_recipe_position',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class RecipePopularity(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='popularity',
+        primary_key=True,
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(
+        verbose_name='Популярность',
+    )
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = [
+            models.Index(
+                fields=['-score', '-recipe'],
+                name='recipe_popularity_rank',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe}: {self.score}'
+
+
+class PopularityCheckpoint(models.Model):
+    processed_until = models.DateTimeField(
+        verbose_name='Активность учтена до',
+    )
+
+    class Meta:
+        verbose_name = 'Отметка расчёта популярности'
+        verbose_name_plural = 'Отметки расчёта популярности'
+
+    def __str__(self):
+        return f'Популярность рассчитана до {self.processed_until}'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Владелец ленты',
+        related_name='feed_entries',
+        on_delete=models.CASCADE,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор рецепта',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Рецепты в лентах'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_entry_user_author',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте у {self.user}'
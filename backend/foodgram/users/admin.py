@@ -5,6 +5,7 @@ from users.models import Follow, User
 
 class UserAdmin(admin.ModelAdmin):
     list_filter = ('email', 'username')
+    readonly_fields = ('recipes_count', 'followers_count')
 
 
 admin.site.register(User, UserAdmin)
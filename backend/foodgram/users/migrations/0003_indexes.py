@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', 'following'], name='follow_follower_following'),
+        ),
+    ]
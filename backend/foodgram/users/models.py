@@ -2,9 +2,42 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """
+    Миксин для моделей со счётчиками, которые изменяются только
+    выражениями F(). При полном сохранении объекта счётчики из
+    COUNTER_FIELDS не записываются: иначе значения, прочитанные в начале
+    запроса, затёрли бы изменения, сделанные параллельно.
+    """
+
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
+    recipes_count = models.IntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+    )
+    followers_count = models.IntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+    )
 
     REQUIRED_FIELDS = ['email', 'first_name', 'last_name']
+    COUNTER_FIELDS = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ('-id',)
@@ -35,6 +68,12 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        indexes = [
+            models.Index(
+                fields=['follower', 'following'],
+                name='follow_follower_following',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['following', 'follower'],